@@ -0,0 +1,3 @@
+"""benchmarks reproduisant les chiffres des messages de commit.
+chaque module se lance depuis la racine du depot: python -m benchmarks.<module>
+les donnees sont synthetiques (benchmarks.donnees), generees a chaque lancement"""
@@ -0,0 +1,76 @@
+"""analyse des pages geco: arbre complet html.parser (code d'origine) contre les analyseurs filtres de amf,
+avec html.parser et lxml s'il est installe. pages generees par le serveur local des tests.
+python -m benchmarks.amf_analyse"""
+
+import datetime
+import decimal
+import time
+import typing
+
+import bs4
+from beancount.core.number import D
+
+from fp_bc import utils
+from fp_bc.sources import amf
+from tests import standin
+
+REPETITIONS = 30
+
+
+def complet_cotation(contenu: bytes) -> typing.Tuple[str, str]:
+    soup = bs4.BeautifulSoup(contenu, "html.parser")
+    values = soup.find_all(class_="ResultatCritereValue")
+    keys = soup.find_all(class_="ResultatCritere")
+    result = dict(zip([v.get_text() for v in keys], [v.get_text() for v in values]))
+    return result["Date VL :"], soup.find("td", string="Valeur (€) :").next_sibling.get_text(strip=True)
+
+
+def complet_identifiants(contenu: bytes) -> str:
+    soup = bs4.BeautifulSoup(contenu, "html.parser")
+    return f'{soup.find("input", {"name": "NumProd"})["value"]}:{soup.find("input", {"name": "NumPart"})["value"]}'
+
+
+def complet_vl(contenu: bytes) -> typing.List[typing.Tuple[datetime.date, decimal.Decimal]]:
+    soup = bs4.BeautifulSoup(contenu, "html.parser")
+    valeurs = []
+    for ligne in soup.find_all("tr", class_=("ligne1", "ligne2")):
+        cellules = ligne.find_all("td")
+        valeurs.append(
+            (utils.strpdate(cellules[0].get_text(strip=True), fmt="%d/%m/%Y"), D(cellules[1].get_text(strip=True).replace(" ", "").replace(",", ".")))
+        )
+    return valeurs
+
+
+def mesure(fonction: typing.Callable[[bytes], typing.Any], contenu: bytes) -> typing.Tuple[float, typing.Any]:
+    resultat = fonction(contenu)
+    debut = time.perf_counter()
+    for _ in range(REPETITIONS):
+        fonction(contenu)
+    return (time.perf_counter() - debut) / REPETITIONS * 1000, resultat
+
+
+def main() -> None:
+    recherche = standin.amf_recherche("FR0000000001").encode("utf-8")
+    historique = standin.amf_historique({"DateDeb": ["1/1/2025"], "DateFin": ["31/12/2025"]}).encode("utf-8")
+    print(f"pages: recherche {len(recherche) // 1024} Kio, historique sur un an {len(historique) // 1024} Kio")
+    parseurs = ["html.parser"]
+    if amf.PARSEUR == "lxml":
+        parseurs.append("lxml")
+    cas = (
+        ("cotation", complet_cotation, amf.analyser_cotation, recherche),
+        ("identifiants", complet_identifiants, amf.analyser_identifiants, recherche),
+        ("historique", complet_vl, amf.analyser_vl, historique),
+    )
+    for nom, complet, filtre, contenu in cas:
+        duree, attendu = mesure(complet, contenu)
+        colonnes = [f"{nom:12} complet html.parser {duree:6.1f} ms"]
+        for parseur in parseurs:
+            amf.PARSEUR = parseur
+            duree, obtenu = mesure(filtre, contenu)
+            assert obtenu == attendu, (nom, parseur)
+            colonnes.append(f"filtre {parseur} {duree:6.1f} ms")
+        print(", ".join(colonnes))
+
+
+if __name__ == "__main__":
+    main()
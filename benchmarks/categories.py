@@ -0,0 +1,61 @@
+"""my_exp.mapping_cat contre CategoryIndex sur un export synthetique: 100k recherches, 600 comptes.
+python -m benchmarks.categories"""
+
+import random
+import string
+import time
+import typing as t
+
+from fp_bc.importers.my_exp import CategoryIndex
+from fp_bc.importers.my_exp import mapping_cat
+
+NB_COMPTES = 600
+NB_RECHERCHES = 100_000
+
+
+class _SansMemo(dict):  # type: ignore[type-arg]
+    """dict qui ne garde rien: mesure find+bisect a chaque appel"""
+
+    def __setitem__(self, cle: t.Any, valeur: t.Any) -> None:
+        pass
+
+
+def main() -> None:
+    rnd = random.Random(0)
+
+    def mot() -> str:
+        return "".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(4, 9)))
+
+    categories = [f"Expenses:{mot().capitalize()}:{mot().capitalize()}" for _ in range(NB_COMPTES)]
+    # les categories de l'export sont des listes [parent, enfant], comme dans my_exp
+    distinctes = [[c.split(":")[1].lower(), c.split(":")[2].lower()] for c in rnd.sample(categories, 200)]
+    recherches = [rnd.choice(distinctes) for _ in range(NB_RECHERCHES)]
+
+    debut = time.perf_counter()
+    references = [mapping_cat(r, categories) for r in recherches]
+    duree_boucle = time.perf_counter() - debut
+
+    sans_memo = CategoryIndex(categories)
+    sans_memo.resultats = _SansMemo()
+    debut = time.perf_counter()
+    resultats = [sans_memo(r) for r in recherches]
+    duree_sans_memo = time.perf_counter() - debut
+    assert resultats == references
+
+    index = CategoryIndex(categories)
+    debut = time.perf_counter()
+    resultats = [index(r) for r in recherches]
+    duree_index = time.perf_counter() - debut
+    assert resultats == references
+
+    print(f"{NB_RECHERCHES} recherches, {NB_COMPTES} comptes:")
+    for nom, duree in (
+        ("boucle mapping_cat", duree_boucle),
+        ("CategoryIndex, find+bisect a chaque appel", duree_sans_memo),
+        ("CategoryIndex avec memo", duree_index),
+    ):
+        print(f"  {nom:<42} {duree:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""time.strptime contre utils.strpdate sur 100k dates: 300 distinctes (cas d'un releve) puis toutes distinctes.
+python -m benchmarks.dates"""
+
+import datetime
+import random
+import time
+import typing as t
+
+from fp_bc import utils
+
+NB_DATES = 100_000
+
+
+def strptime(var: str, fmt: str) -> datetime.date:
+    """conversion d'origine de strpdate, sans memo"""
+    e = time.strptime(var, fmt)
+    return datetime.date(e.tm_year, e.tm_mon, e.tm_mday)
+
+
+def mesure(fonction: t.Callable[[str, str], datetime.date], colonne: t.List[str], fmt: str) -> t.Tuple[float, t.List[datetime.date]]:
+    utils._MEMO_DATE.clear()
+    debut = time.perf_counter()
+    resultat = [fonction(v, fmt) for v in colonne]
+    return time.perf_counter() - debut, resultat
+
+
+def main() -> None:
+    rnd = random.Random(5)
+    distinctes = [(datetime.date(2015, 1, 1) + datetime.timedelta(days=rnd.randint(0, 3000))).strftime("%d.%m.%Y") for _ in range(300)]
+    cas = (
+        ("300 distinctes", [rnd.choice(distinctes) for _ in range(NB_DATES)], "%d.%m.%Y"),
+        ("toutes distinctes", [(datetime.date(1900, 1, 1) + datetime.timedelta(days=i)).strftime("%d/%m/%Y") for i in range(NB_DATES)], "%d/%m/%Y"),
+    )
+    for nom, colonne, fmt in cas:
+        duree_ref, attendu = mesure(strptime, colonne, fmt)
+        duree, obtenu = mesure(utils.strpdate, colonne, fmt)
+        assert obtenu == attendu
+        print(f"{nom:17} time.strptime {duree_ref:.3f}s  strpdate {duree:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""generateurs de donnees synthetiques pour les benchmarks"""
+
+import datetime
+import decimal
+import random
+import typing as t
+
+from beancount.core import amount
+from beancount.core import data
+from beancount.core import position
+from beancount.core.number import D
+
+TIERS = ["AUCHAN PARIS", "BURGER KING 12", "CARREFOUR CITY", "SNCF INTERNET", "BK253 LYON", "PHARMACIE DU CENTRE", "CAFÉ DE FLORE"]
+
+
+def _date(rnd: random.Random, separateur: str = "/") -> str:
+    return separateur.join((f"{rnd.randint(1, 28):02d}", f"{rnd.randint(1, 12):02d}", f"20{rnd.randint(15, 23)}"))
+
+
+def _montant(rnd: random.Random, milliers: str) -> str:
+    """montant francais ("1 234,56", milliers=" ") ou allemand ("1.234,56", milliers=".")"""
+    v = rnd.randint(-300000, 300000)
+    texte = f"{abs(v) // 100:,}".replace(",", milliers) + f",{abs(v) % 100:02d}"
+    return ("-" if v < 0 else "") + texte
+
+
+def releve_sg(chemin: str, nb_lignes: int, graine: int = 42) -> None:
+    """releve societe generale au format champs1 (date;libelle;detail;montant;devise)"""
+    rnd = random.Random(graine)
+    with open(chemin, "w", encoding="windows-1252", newline="") as f:
+        f.write('="0123456789";\r\n"date";"libelle";"detail";"montant";"devise"\r\n')
+        for i in range(nb_lignes):
+            tiers = rnd.choice(TIERS)
+            detail = (
+                f"CARTE X1234 {_date(rnd)[:5]} {tiers} COMMERCE ELECTRONIQUE",
+                f"CARTE X1234 RETRAIT DAB SG {_date(rnd)[:5]} 12H30 PARIS",
+                f"PRELEVEMENT EUROPEEN 123 DE: {tiers} ID: FR12ZZZ",
+                f"VIR RECU 1234 DE: {tiers} MOTIF: SALAIRE REF: 12",
+                f"VIR EUROPEEN EMIS   LOGITEL POUR: {tiers} REF: 123",
+                "VIR PERM GENERATION VIE",
+            )[i % 6]
+            f.write(f'{_date(rnd)};"{tiers}";"{detail}";{_montant(rnd, " ")};EUR\r\n')
+
+
+def releve_pb(chemin: str, nb_lignes: int, graine: int = 42) -> None:
+    """releve postbank: 8 lignes d'entete dont le solde, puis les operations"""
+    rnd = random.Random(graine)
+    with open(chemin, "w", encoding="windows-1250", newline="") as f:
+        f.write("Umsatzauskunft;\r\n;\r\nKonto;123\r\n;\r\nZeitraum;x\r\nKontostand;1.234,56 €\r\n;\r\n")
+        f.write("Buchungstag;Wertstellung;Umsatzart;Buchungsdetails;Auftraggeber;Empfänger;Betrag (€);Saldo (€)\r\n")
+        for i in range(nb_lignes):
+            tiers = rnd.choice(TIERS)
+            jour = _date(rnd, ".")
+            ligne = (
+                [jour, jour, "Gutschrift", "Lohn", tiers, "moi"],
+                [jour, jour, "Dauerauftrag", "Miete", "moi", tiers],
+                [jour, jour, "Überweisung", "x", tiers, "moi"],
+                [jour, jour, "Zinsen", "Zinsen", "", ""],
+                [jour, jour, "Kreditkartenumsatz", "ABRECHNUNG VOM 12.01.23", "", ""],
+            )[i % 5]
+            f.write(";".join(ligne + [_montant(rnd, ".") + " €", "1.000,00 €"]) + "\r\n")
+
+
+def ledger(nb_transactions: int, graine: int = 1, nb_titres: int = 300, nb_prix: int = 2000) -> t.List[data.Directive]:
+    """ledger melange sur 15 ans, trie: achats au cout de fonds, ventes de lots avec prix, conversions de devise
+    sur carte de voyage, depenses courantes, et nb_prix directives price explicites"""
+    rnd = random.Random(graine)
+    debut = datetime.date(2010, 1, 1)
+    jours = 15 * 365
+    titres = [f"FOND{i:03d}" for i in range(nb_titres)]
+    comptes = [f"Assets:Broker{i}" for i in range(8)]
+    lots: t.Dict[t.Tuple[str, str], t.List[t.Tuple[position.Cost, decimal.Decimal]]] = {}
+
+    def somme(mini: int, maxi: int) -> decimal.Decimal:
+        return D(f"{rnd.randint(mini, maxi) / 100:.2f}")
+
+    entries: t.List[data.Directive] = []
+    for i in range(nb_transactions):
+        date = debut + datetime.timedelta(days=i * jours // nb_transactions)
+        tirage = rnd.random()
+        if tirage < 0.22:
+            compte, titre = rnd.choice(comptes), rnd.choice(titres)
+            nombre, cout = D(rnd.randint(1, 50)), somme(1000, 50000)
+            lot = position.Cost(cout, "EUR", date, None)
+            lots.setdefault((compte, titre), []).append((lot, nombre))
+            postings = [
+                data.Posting(compte, amount.Amount(nombre, titre), lot, None, None, None),
+                data.Posting("Assets:Cash", amount.Amount(-nombre * cout, "EUR"), None, None, None, None),
+            ]
+        elif tirage < 0.42 and lots:
+            cle = rnd.choice(list(lots))
+            lot, nombre = lots[cle][0]
+            vendu = nombre if rnd.random() < 0.6 else min(nombre, D(rnd.randint(1, 20)))
+            if vendu == nombre:
+                lots[cle].pop(0)
+                if not lots[cle]:
+                    del lots[cle]
+            else:
+                lots[cle][0] = (lot, nombre - vendu)
+            prix = somme(1000, 50000)
+            postings = [
+                data.Posting(cle[0], amount.Amount(-vendu, cle[1]), lot, amount.Amount(prix, "EUR"), None, None),
+                data.Posting("Assets:Cash", amount.Amount(vendu * prix, "EUR"), None, None, None, None),
+                data.Posting("Income:PnL", amount.Amount(vendu * (lot.number - prix), "EUR"), None, None, None, None),
+            ]
+        elif tirage < 0.57:
+            devise = rnd.choice(("USD", "GBP", "CHF", "JPY"))
+            nombre, taux = somme(100, 100000), D(f"{rnd.randint(80, 130) / 100:.4f}")
+            postings = [
+                data.Posting("Expenses:Voyage", amount.Amount(nombre, devise), None, amount.Amount(taux, "EUR"), None, None),
+                data.Posting("Liabilities:Carte", amount.Amount(-(nombre * taux).quantize(D("0.01")), "EUR"), None, None, None, None),
+            ]
+        else:
+            nombre = somme(100, 20000)
+            postings = [
+                data.Posting("Expenses:Courses", amount.Amount(nombre, "EUR"), None, None, None, None),
+                data.Posting("Assets:Banque", amount.Amount(-nombre, "EUR"), None, None, None, None),
+            ]
+        meta = data.new_metadata("/ledger/main.beancount", i + 1)
+        entries.append(data.Transaction(meta, date, "*", None, f"op {i}", data.EMPTY_SET, data.EMPTY_SET, postings))
+    for j in range(nb_prix):
+        date = debut + datetime.timedelta(days=rnd.randrange(jours))
+        meta = data.new_metadata("/ledger/prix.beancount", j + 1)
+        entries.append(data.Price(meta, date, rnd.choice(titres), amount.Amount(somme(1000, 50000), "EUR")))
+    entries.sort(key=data.entry_sortkey)
+    return entries
+
+
+def ledger_usd(nb_transactions: int, graine: int = 5, nb_titres: int = 300) -> t.List[data.Directive]:
+    """ledger d'achats de fonds en dollars payes en euros: chaque transaction donne un prix au cout
+    et un prix de conversion USD/EUR"""
+    rnd = random.Random(graine)
+    debut = datetime.date(2010, 1, 1)
+    entries: t.List[data.Directive] = []
+    for i in range(nb_transactions):
+        date = debut + datetime.timedelta(days=i * 15 * 365 // nb_transactions)
+        nombre, cout = D(rnd.randint(1, 50)), D(f"{rnd.randint(1000, 50000) / 100:.2f}")
+        taux = D(f"{rnd.randint(80, 130) / 100:.4f}")
+        postings = [
+            data.Posting("Assets:Broker", amount.Amount(nombre, f"US{rnd.randrange(nb_titres):03d}"), position.Cost(cout, "USD", date, None), None, None, None),
+            data.Posting("Assets:Broker", amount.Amount(-nombre * cout, "USD"), None, amount.Amount(taux, "EUR"), None, None),
+            data.Posting("Assets:Banque", amount.Amount((nombre * cout * taux).quantize(D("0.01")), "EUR"), None, None, None, None),
+        ]
+        meta = data.new_metadata("/ledger/us.beancount", i + 1)
+        entries.append(data.Transaction(meta, date, "*", None, "", data.EMPTY_SET, data.EMPTY_SET, postings))
+    return entries
@@ -0,0 +1,47 @@
+"""lignes/s de CsvUnicodeReader et CsvFastReader sur des releves SG et Postbank de 50k lignes.
+python -m benchmarks.lecteurs_csv"""
+
+import os
+import tempfile
+import time
+
+from benchmarks import donnees
+from fp_bc import utils
+
+NB_LIGNES = 50_000
+CAS = (
+    ("SG", donnees.releve_sg, "windows-1252", ["date", "libelle", "detail", "montant", "devise"], 2, ["date", "montant"]),
+    (
+        "Postbank",
+        donnees.releve_pb,
+        "windows-1250",
+        ["date", "valeur", "moyen", "detail", "autorite", "tiers", "montant", "solde"],
+        8,
+        ["date", "moyen", "montant"],
+    ),
+)
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as repertoire:
+        for nom, generer, encodage, champs, saut, colonnes in CAS:
+            chemin = os.path.join(repertoire, f"{nom}.csv")
+            generer(chemin, NB_LIGNES)
+            for classe in (utils.CsvUnicodeReader, utils.CsvFastReader):
+                meilleur = float("inf")
+                for _ in range(3):
+                    with open(chemin, encoding=encodage) as fichier:
+                        debut = time.perf_counter()
+                        nb = 0
+                        # detail et 2-3 colonnes par ligne, comme les importers
+                        for row in classe(fichier, champs=champs, ligne_saut=saut, champ_detail="detail"):
+                            row.detail
+                            for colonne in colonnes:
+                                row.row[colonne]
+                            nb += 1
+                        meilleur = min(meilleur, time.perf_counter() - debut)
+                print(f"{nom:9} {classe.__name__:17} {nb / meilleur:>10.0f} lignes/s")
+
+
+if __name__ == "__main__":
+    main()
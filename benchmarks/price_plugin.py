@@ -0,0 +1,66 @@
+"""price_plugin contre sa version d'origine (benchmarks.price_plugin_origine) sur un ledger synthetique:
+meilleur temps sur 3 passes et pic memoire (tracemalloc), sur un ledger melange et un ledger d'achats en dollars.
+la derniere ligne de chaque ledger parcourt iter_prices sans construire la liste de sortie.
+python -m benchmarks.price_plugin [nombre de transactions, 500000 par defaut]"""
+
+import gc
+import sys
+import time
+import tracemalloc
+import typing as t
+
+from beancount.core import data
+
+from benchmarks import donnees
+from benchmarks import price_plugin_origine
+from fp_bc.plugins import price_plugin
+
+PLUGINS = (("origine", price_plugin_origine.add_implicit_prices), ("price_plugin", price_plugin.add_implicit_prices))
+
+
+def mesure(plugin: t.Callable[..., t.Any], entries: t.List[data.Directive], *args: t.Any) -> t.Tuple[float, float, t.List[data.Directive]]:
+    """@return meilleur temps en secondes, pic memoire en Mio, entries renvoyees"""
+    durees = []
+    for _ in range(3):
+        gc.collect()
+        debut = time.perf_counter()
+        resultat, _ = plugin(entries, {}, *args)
+        durees.append(time.perf_counter() - debut)
+        del resultat
+    gc.collect()
+    tracemalloc.start()
+    resultat, _ = plugin(entries, {}, *args)
+    pic = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(durees), pic / 2**20, resultat
+
+
+def compare(entries: t.List[data.Directive]) -> None:
+    reference = None
+    for nom, plugin in PLUGINS:
+        duree, pic, resultat = mesure(plugin, entries)
+        if reference is None:
+            reference = resultat
+        else:
+            assert resultat == reference
+        nb_prix = sum(isinstance(entry, data.Price) for entry in resultat)
+        print(f"  {nom:16} {duree:6.2f}s  pic {pic:6.0f} Mio  {nb_prix} prix")
+    gc.collect()
+    tracemalloc.start()
+    nb_entries = sum(1 for _ in price_plugin.iter_prices(entries))
+    pic = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert reference is not None and nb_entries == len(reference)
+    print(f"  {'iter_prices':16} {'':7}  pic {pic / 2**20:6.0f} Mio")
+
+
+def main() -> None:
+    nombre = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    print(f"ledger melange, {nombre} transactions")
+    compare(donnees.ledger(nombre))
+    print(f"ledger en dollars, {nombre // 2} transactions")
+    compare(donnees.ledger_usd(nombre // 2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""price_plugin selon sa configuration sur le ledger melange: tous les prix, puis seulement ceux des fonds,
+sans les devises des cartes de voyage, limites aux comptes Assets, ou a partir de 2020.
+python -m benchmarks.price_plugin_config [nombre de transactions, 500000 par defaut]"""
+
+import sys
+import typing as t
+
+from beancount.core import data
+
+from benchmarks import donnees
+from benchmarks.price_plugin import mesure
+from fp_bc.plugins import price_plugin
+
+CONFIGS = (
+    ("tout", None),
+    ("fonds", repr({"commodities": [f"FOND{i:03d}" for i in range(300)]})),
+    ("sans devises", repr({"exclude_commodities": ["USD", "GBP", "CHF", "JPY"]})),
+    ("comptes Assets", repr({"accounts": ["Assets"]})),
+    ("depuis 2020", repr({"since": "2020-01-01"})),
+)
+
+
+def prix_fonds(entries: t.List[data.Directive]) -> t.List[data.Price]:
+    return [entry for entry in entries if isinstance(entry, data.Price) and entry.currency.startswith("FOND")]
+
+
+def main() -> None:
+    nombre = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    entries = donnees.ledger(nombre)
+    print(f"ledger melange, {nombre} transactions")
+    reference = None
+    for nom, config in CONFIGS:
+        duree, pic, resultat = mesure(price_plugin.add_implicit_prices, entries, config)
+        nb_prix = sum(isinstance(entry, data.Price) for entry in resultat)
+        if reference is None:
+            reference = prix_fonds(resultat)
+        elif nom != "depuis 2020":
+            # exclure les devises ne change ni la reservation des lots ni les prix des fonds
+            assert prix_fonds(resultat) == reference, nom
+        print(f"  {nom:14} {duree:6.2f}s  pic {pic:6.0f} Mio  {nb_prix} prix")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""derniers prix amf demandes un par un puis en parallele (batch.get_latest_prices) a un serveur local avec latence.
+python -m benchmarks.prix_batch"""
+
+import time
+import typing
+
+from fp_bc.sources import amf
+from fp_bc.sources import batch
+from fp_bc.sources import price_cache
+from tests import standin
+
+LATENCE = 0.1
+ISINS = [f"FR{i:010d}" for i in range(60)]
+
+
+def main() -> None:
+    serveur, url = standin.demarrer()
+    amf.URL_GECO = url
+    cas: typing.Tuple[typing.Tuple[str, batch.Limite, typing.Callable[[typing.List[str]], typing.List[typing.Any]]], ...] = (
+        ("un par un sans limite", batch.Limite(1000.0, 1000, 1), lambda isins: [amf.Source().get_latest_price(isin) for isin in isins]),
+        ("batch, limite geco (2 req/s)", batch.LIMITES["geco.amf-france.org"], amf.Source().get_latest_prices),
+        ("batch, 8 connexions", batch.Limite(20.0, 8, 8), amf.Source().get_latest_prices),
+    )
+    reference = None
+    for nom, limite, fonction in cas:
+        price_cache.set_cache(price_cache.PriceCache(":memory:"))
+        batch.configurer(url, limite)
+        standin.reinitialiser()
+        standin.ETAT["latence"] = LATENCE
+        debut = time.perf_counter()
+        prix = fonction(ISINS)
+        duree = time.perf_counter() - debut
+        assert None not in prix and (reference is None or prix == reference)
+        reference = prix
+        print(
+            f"{nom:29} {duree:6.2f}s  {standin.ETAT['requetes']['total']} requetes, "
+            f"{standin.ETAT['max_actives']} simultanees au plus"
+        )
+    serveur.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""debit de rules.TiersRules contre la boucle re.search historique, pour 100, 1000 et 10000 regles.
+python -m benchmarks.regles_tiers"""
+
+import random
+import re
+import string
+import time
+import typing as t
+
+from fp_bc.rules import TiersRules
+
+NB_LIGNES = 2000
+
+
+def boucle_re_search(regles: t.Sequence[t.Tuple[str, str]], tiers: str) -> str:
+    """comportement historique de tiers_update_verifie: la derniere regle qui correspond gagne"""
+    for regle in regles:
+        if re.search(regle[0], tiers, re.UNICODE | re.IGNORECASE):
+            tiers = regle[1]
+    return tiers
+
+
+def mot(rnd: random.Random) -> str:
+    return "".join(rnd.choice(string.ascii_uppercase) for _ in range(rnd.randint(4, 9)))
+
+
+def generer(nb_regles: int, rnd: random.Random) -> t.Tuple[t.List[t.Tuple[str, str]], t.List[str]]:
+    """un tiers de regles sont des regexps, la moitie des lignes correspond a une regle"""
+    regles = []
+    for i in range(nb_regles):
+        m = mot(rnd)
+        regles.append((m if i % 3 else m + r" .*\d+", m.capitalize()))
+    lignes = [
+        rnd.choice(regles)[0].replace(r" .*\d+", " 12") + " PARIS" if rnd.random() < 0.5 else mot(rnd) + " " + mot(rnd)
+        for _ in range(NB_LIGNES)
+    ]
+    return regles, lignes
+
+
+def main() -> None:
+    rnd = random.Random(0)
+    for nb_regles in (100, 1000, 10000):
+        regles, lignes = generer(nb_regles, rnd)
+        moteur = TiersRules(regles)
+        debut = time.perf_counter()
+        resultats = [moteur.appliquer(ligne) for ligne in lignes]
+        milieu = time.perf_counter()
+        # la boucle historique est trop lente a 10000 regles pour toutes les lignes
+        nb_ref = NB_LIGNES if nb_regles < 10000 else 200
+        references = [boucle_re_search(regles, ligne) for ligne in lignes[:nb_ref]]
+        fin = time.perf_counter()
+        assert resultats[:nb_ref] == references
+        print(
+            f"{nb_regles:>6} regles: moteur {NB_LIGNES / (milieu - debut):>10.0f} lignes/s, "
+            f"boucle re.search {nb_ref / (fin - milieu):>8.0f} lignes/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
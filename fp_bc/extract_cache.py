@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""cache disque des resultats d'extract, adresse par le contenu du fichier et la config de l'importer"""
+
+import glob
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import re
+import sys
+import types
+import typing as t
+
+from beancount.ingest import importer
+
+from fp_bc import utils_bc
+
+NoneType = type(None)
+TYPES_CONFIG = (str, int, float, bool, NoneType)
+
+
+def _donnee_simple(valeur: t.Any) -> bool:
+    """renvoie True pour les valeurs de config: types simples et conteneurs de types simples"""
+    if isinstance(valeur, TYPES_CONFIG):
+        return True
+    if isinstance(valeur, (list, tuple)):
+        return all(_donnee_simple(v) for v in valeur)
+    if isinstance(valeur, dict):
+        return all(_donnee_simple(k) and _donnee_simple(v) for k, v in valeur.items())
+    return False
+
+
+def modules_fp_bc(module: types.ModuleType) -> t.List[types.ModuleType]:
+    """le module et tous les modules du paquet fp_bc dont il depend, directement ou non
+    (import de module ou de nom: from fp_bc.utils import CsvFastReader)"""
+    trouves: t.Dict[str, types.ModuleType] = {}
+    a_voir = [module]
+    while a_voir:
+        courant = a_voir.pop()
+        if courant.__name__ in trouves:
+            continue
+        trouves[courant.__name__] = courant
+        for valeur in vars(courant).values():
+            nom = valeur.__name__ if isinstance(valeur, types.ModuleType) else getattr(valeur, "__module__", None)
+            if isinstance(nom, str) and nom.split(".")[0] == "fp_bc" and nom not in trouves and nom in sys.modules:
+                a_voir.append(sys.modules[nom])
+    return [trouves[nom] for nom in sorted(trouves)]
+
+
+def hash_config(imp: importer.ImporterProtocol) -> str:
+    """hash de la configuration d'un importer: tous les attributs de donnees simples
+    (tiers_update, tiers_cat, comptes, devise...) et le source du module de l'importer
+    et des modules de fp_bc qu'il utilise (utils, rules, utils_bc...)"""
+    config = {nom: valeur for nom, valeur in vars(imp).items() if _donnee_simple(valeur)}
+    sha = hashlib.sha256(repr(sorted(config.items())).encode("utf-8"))
+    module = sys.modules.get(type(imp).__module__)
+    for dependance in modules_fp_bc(module) if module is not None else []:
+        try:
+            with open(inspect.getfile(dependance), "rb") as f:
+                sha.update(dependance.__name__.encode("utf-8"))
+                sha.update(f.read())
+        except (OSError, TypeError):
+            pass
+    return sha.hexdigest()
+
+
+def hash_fichier(filename: str) -> str:
+    sha = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+class ExtractCache:
+    """stocke le resultat d'extract dans un repertoire, un fichier pickle par (contenu, importer, config).
+    la taille totale est bornee: les entrees les moins recemment utilisees sont supprimees"""
+
+    def __init__(self, repertoire: str, taille_max: int = 256 * 1024 * 1024) -> None:
+        self.repertoire = repertoire
+        self.taille_max = taille_max
+        self.hits = 0
+        self.misses = 0
+        self.log = logging.getLogger("extract_cache")
+        self._configs: t.Dict[int, str] = {}
+        os.makedirs(repertoire, exist_ok=True)
+
+    @staticmethod
+    def prefixe(imp: importer.ImporterProtocol) -> str:
+        return re.sub(r"[^\w.-]", "_", f"{type(imp).__name__}-{imp.name()}")
+
+    def cle(self, imp: importer.ImporterProtocol, filename: str) -> str:
+        """nom du fichier de cache pour ce fichier et cet importer"""
+        config = self._configs.get(id(imp))
+        if config is None:
+            config = self._configs[id(imp)] = hash_config(imp)
+        sha = hashlib.sha256(f"{hash_fichier(filename)}:{type(imp).__qualname__}:{imp.name()}:{config}".encode("utf-8"))
+        return f"{self.prefixe(imp)}-{sha.hexdigest()}.pickle"
+
+    def get(self, cle: str, filename: str) -> t.Optional[t.List[utils_bc.bc_directives]]:
+        chemin = os.path.join(self.repertoire, cle)
+        try:
+            with open(chemin, "rb") as f:
+                filename_origine, entries = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        os.utime(chemin)
+        if filename_origine != filename:
+            # meme contenu a un autre endroit: les meta doivent pointer sur le fichier demande
+            for entry in entries:
+                if entry.meta.get("filename") == filename_origine:
+                    entry.meta["filename"] = filename
+        return entries
+
+    def put(self, cle: str, filename: str, entries: t.List[utils_bc.bc_directives]) -> None:
+        chemin = os.path.join(self.repertoire, cle)
+        temporaire = f"{chemin}.{os.getpid()}.tmp"
+        with open(temporaire, "wb") as f:
+            pickle.dump((filename, entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporaire, chemin)
+        self.evince()
+
+    def evince(self) -> None:
+        """supprime les entrees les plus anciennement utilisees tant que la taille depasse taille_max"""
+        fichiers = []
+        for chemin in glob.glob(os.path.join(self.repertoire, "*.pickle")):
+            stat = os.stat(chemin)
+            fichiers.append((stat.st_mtime_ns, stat.st_size, chemin))
+        total = sum(taille for _, taille, _ in fichiers)
+        for _, taille, chemin in sorted(fichiers):
+            if total <= self.taille_max:
+                break
+            os.remove(chemin)
+            total -= taille
+
+    def invalider(self, imp: t.Optional[importer.ImporterProtocol] = None) -> int:
+        """supprime toutes les entrees, ou seulement celles d'un importer (ex: apres modification des regles)
+        @return nombre d'entrees supprimees"""
+        motif = "*.pickle" if imp is None else f"{glob.escape(self.prefixe(imp))}-*.pickle"
+        supprimes = 0
+        for chemin in glob.glob(os.path.join(self.repertoire, motif)):
+            os.remove(chemin)
+            supprimes += 1
+        self._configs.clear()
+        return supprimes
+
+    def extract(
+        self, imp: importer.ImporterProtocol, file: t.Any, existing_entries: t.Optional[t.List[utils_bc.bc_directives]] = None
+    ) -> t.Optional[t.List[utils_bc.bc_directives]]:
+        """extract avec cache. les importers dont le resultat depend de existing_entries ne sont pas caches"""
+        if getattr(imp, "utilise_existing_entries", False):
+            return imp.extract(file, existing_entries)
+        cle = self.cle(imp, file.name)
+        entries = self.get(cle, file.name)
+        if entries is None:
+            entries = imp.extract(file, existing_entries)
+            if entries is not None:
+                self.put(cle, file.name, entries)
+        return entries
+
+    def stats(self) -> str:
+        return f"cache extraction: {self.hits} hits, {self.misses} misses"
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""extraction en parallele d'un repertoire de releves"""
+
+import collections
+import concurrent.futures
+import logging
+import os
+import traceback
+import typing as t
+
+from beancount.ingest import cache
+from beancount.ingest import importer
+
+from fp_bc import extract_cache
+from fp_bc import utils_bc
+
+ExtractionError = collections.namedtuple("ExtractionError", "filename message")
+ResultatFichier = collections.namedtuple("ResultatFichier", "filename importer entries error")
+
+# etat de chaque processus, positionne une seule fois par l'initializer du pool
+_importers: t.Sequence[importer.ImporterProtocol] = ()
+_existing_entries: t.Optional[t.List[utils_bc.bc_directives]] = None
+
+
+def _initialise(importers: t.Sequence[importer.ImporterProtocol], existing_entries: t.Optional[t.List[utils_bc.bc_directives]]) -> None:
+    global _importers, _existing_entries
+    _importers = importers
+    _existing_entries = existing_entries
+
+
+def _importer(file: t.Any) -> t.Optional[int]:
+    """indice du premier importer qui reconnait le fichier"""
+    for index, imp in enumerate(_importers):
+        if imp.identify(file):
+            return index
+    return None
+
+
+def _traiter(filename: str, index: t.Optional[int] = None) -> ResultatFichier:
+    """identifie (si index n'est pas deja connu) puis extrait un fichier avec le premier importer qui le reconnait"""
+    log = logging.getLogger("extraction")
+    file = cache.get_file(filename)
+    nom = None
+    try:
+        if index is None:
+            index = _importer(file)
+            if index is None:
+                return ResultatFichier(filename, None, [], None)
+        imp = _importers[index]
+        nom = imp.name()
+        log.info(f"{filename}: {nom}")
+        entries = imp.extract(file, _existing_entries)
+    except Exception as exp:  # pylint: disable=W0703
+        return ResultatFichier(filename, nom, [], f"{exp!r}\n{traceback.format_exc()}")
+    if entries is None:
+        return ResultatFichier(filename, nom, [], "extract n'a renvoye aucune directive (erreur dans le fichier)")
+    return ResultatFichier(filename, nom, list(entries), None)
+
+
+def _traiter_indexe(tache: t.Tuple[str, t.Optional[int]]) -> ResultatFichier:
+    return _traiter(*tache)
+
+
+def liste_fichiers(chemins: t.Union[str, t.Iterable[str]]) -> t.List[str]:
+    """renvoie la liste triee des fichiers d'un repertoire (recursivement) ou la liste des chemins donnes,
+    sans doublon (un chemin repete n'est extrait qu'une fois, a sa premiere position)"""
+    if isinstance(chemins, str):
+        if not os.path.isdir(chemins):
+            return [chemins]
+        fichiers = []
+        for racine, _, noms in os.walk(chemins):
+            fichiers.extend(os.path.join(racine, nom) for nom in noms)
+        return sorted(fichiers)
+    return list(dict.fromkeys(chemins))
+
+
+def extract_fichiers(
+    importers: t.Sequence[importer.ImporterProtocol],
+    chemins: t.Union[str, t.Iterable[str]],
+    existing_entries: t.Optional[t.List[utils_bc.bc_directives]] = None,
+    workers: t.Optional[int] = None,
+    cache_extraction: t.Optional[extract_cache.ExtractCache] = None,
+) -> t.Tuple[t.List[utils_bc.bc_directives], t.List[ExtractionError]]:
+    """extrait en parallele les fichiers independants d'un repertoire de releves.
+    @param importers: importers de la config, ils sont envoyes une fois a chaque processus (donc picklables)
+    @param chemins: repertoire ou liste de fichiers
+    @param existing_entries: passe a chaque extract
+    @param workers: nombre de processus, par defaut le nombre de coeurs. 1 traite tout dans le processus courant
+    @param cache_extraction: si renseigne, les fichiers deja extraits avec la meme config ne sont pas relus
+    @return les directives de tous les fichiers, fusionnees dans l'ordre des fichiers puis triees avec utils_bc.sort,
+    et les erreurs par fichier. une erreur dans un fichier n'arrete pas les autres
+    """
+    log = logging.getLogger("extraction")
+    fichiers = liste_fichiers(chemins)
+    resultats: t.List[t.Optional[ResultatFichier]] = [None] * len(fichiers)
+    taches: t.List[t.Tuple[str, t.Optional[int]]] = [(f, None) for f in fichiers]
+    cles: t.Dict[str, str] = {}
+    if cache_extraction is not None:
+        # identification et lecture du cache dans ce processus: seuls les fichiers absents du cache partent au pool
+        _initialise(importers, existing_entries)
+        taches = []
+        for position, filename in enumerate(fichiers):
+            nom = None
+            try:
+                index = _importer(cache.get_file(filename))
+                if index is None:
+                    resultats[position] = ResultatFichier(filename, None, [], None)
+                    continue
+                imp = importers[index]
+                nom = imp.name()
+                if not getattr(imp, "utilise_existing_entries", False):
+                    cles[filename] = cache_extraction.cle(imp, filename)
+                    entries = cache_extraction.get(cles[filename], filename)
+                    if entries is not None:
+                        resultats[position] = ResultatFichier(filename, nom, entries, None)
+                        continue
+            except Exception as exp:  # pylint: disable=W0703
+                # comme dans _traiter: l'erreur est gardee pour ce fichier, les autres continuent
+                resultats[position] = ResultatFichier(filename, nom, [], f"{exp!r}\n{traceback.format_exc()}")
+                continue
+            taches.append((filename, index))
+        _initialise((), None)
+    if workers == 1 or len(taches) <= 1:
+        _initialise(importers, existing_entries)
+        try:
+            calcules = [_traiter_indexe(tache) for tache in taches]
+        finally:
+            _initialise((), None)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_initialise, initargs=(importers, existing_entries)
+        ) as pool:
+            # map renvoie les resultats dans l'ordre des fichiers
+            calcules = list(pool.map(_traiter_indexe, taches))
+    positions = {filename: position for position, filename in enumerate(fichiers)}
+    for resultat in calcules:
+        resultats[positions[resultat.filename]] = resultat
+        if cache_extraction is not None and resultat.error is None and resultat.filename in cles:
+            cache_extraction.put(cles[resultat.filename], resultat.filename, resultat.entries)
+    if cache_extraction is not None:
+        log.info(cache_extraction.stats())
+    entries_finales: t.List[utils_bc.bc_directives] = []
+    errors: t.List[ExtractionError] = []
+    for resultat in resultats:
+        assert resultat is not None
+        if resultat.error is not None:
+            errors.append(ExtractionError(resultat.filename, f"{resultat.importer}: {resultat.error}"))
+        entries_finales.extend(resultat.entries)
+    # le tri est stable: a cle egale, l'ordre des fichiers est conserve
+    return utils_bc.sort(entries_finales), errors
@@ -14,8 +14,10 @@ from beancount.core import flags
 from beancount.ingest import importer  # noqa
 from beancount.ingest import cache
 
-from fp_bc.utils import CsvUnicodeReader
+from fp_bc.utils import CsvFastReader
 from fp_bc import utils
+from fp_bc import rules
+from fp_bc import utils_bc
 
 
 __version__ = "1.1.0"
@@ -62,6 +64,7 @@ class ImporterBoursorama(importer.ImporterProtocol):
         account_id: str,
     ) -> None:
         self.tiers_update = tiers_update
+        self.regles_tiers = rules.TiersRules(tiers_update)
         self.tiers_cat = tiers_cat
         self.logger = logging.getLogger(__file__)  # pylint: disable=W0612
         self.currency = currency
@@ -70,6 +73,7 @@ class ImporterBoursorama(importer.ImporterProtocol):
         self.cat_default = cat_default
         self.account_visa = account_visa  # si none pas de gestion d'un compte separé visa
         self.account_id = account_id
+        self.regles_cat = rules.CatRules(tiers_cat, cat_default)
 
     def name(self) -> str:
         # permet d'avoir deux comptess bourso et de pouvoir les differenciers au niveau de la config
@@ -94,26 +98,26 @@ class ImporterBoursorama(importer.ImporterProtocol):
             self.logger.error(f"error , problem assertion {pprint.pformat(exp)} in the transaction {pprint.pformat(entry)}")
 
     def cat(self, tiers: str) -> str:
-        for regle_cat in self.tiers_cat:
-            if re.search(regle_cat[0], tiers, re.UNICODE | re.IGNORECASE):
-                return regle_cat[1]
-        return self.cat_default
+        return self.regles_cat.resoudre(tiers)
 
     def tiers_update_verifie(self, tiers: str) -> str:
-        for regle_tiers in self.tiers_update:
-            if re.search(regle_tiers[0], tiers, re.UNICODE | re.IGNORECASE):
-                tiers = regle_tiers[1]
-        else:
-            tiers = tiers.capitalize()
-        return tiers
+        # la boucle historique finissait toujours par le else sans break: capitalize systematique
+        tiers = self.regles_tiers.appliquer(tiers)
+        return tiers.capitalize()
 
     def extract(self, file: t.IO, existing_entries: t.Optional[t.List[bc_directives]] = None) -> t.List[bc_directives]:  # type: ignore[override]
+        entries, erreurs = utils_bc.collect(self.iter_extract(file, existing_entries))
+        if erreurs:
+            raise Exception("au moins une erreur")
+        return entries
+
+    def iter_extract(self, file: t.IO, existing_entries: t.Optional[t.List[bc_directives]] = None) -> t.Generator[bc_directives, None, int]:
+        """renvoie les directives au fur et a mesure de la lecture du fichier, puis le nombre de lignes en erreur"""
         # Open the CSV file and create directives.
-        entries: t.List[bc_directives] = []
-        error = False
+        erreurs = 0
         with open(file.name, "r", encoding="windows-1252") as fichier:
             for index, row in enumerate(
-                CsvUnicodeReader(
+                CsvFastReader(
                     fichier,
                     champs=[
                         "dateOp",
@@ -142,7 +146,7 @@ class ImporterBoursorama(importer.ImporterProtocol):
                 try:
                     montant_releve = amount.Amount(utils.to_decimal(row.row["amount"]), self.currency)
                 except decimal.InvalidOperation:
-                    error = True
+                    erreurs += 1
                     self.logger.error(f"montant '{row.row['amount']}' invalide pour operation ligne {index}")
                     continue
                 date_releve = utils.strpdate(row.row["dateOp"])
@@ -186,7 +190,7 @@ class ImporterBoursorama(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                     continue
                 # paiment carte visa
                 if row.in_detail(r"^CARTE (?P<date>\d\d\/\d\d\/\d\d)"):  # cas general de la visa
@@ -197,11 +201,11 @@ class ImporterBoursorama(importer.ImporterProtocol):
                         tiers = retour.group("desc").strip()
                         date_visa = utils.strpdate(f"{retour.group('date')[0:5]}/20{retour.group('date')[6:8]}", "%d/%m/%Y")
                         if not tiers:
-                            error = True
+                            erreurs += 1
                             self.logger.error("attention , probleme regex visa pour operation ligne %s", index)
                             continue
                     else:
-                        error = True
+                        erreurs += 1
                         self.logger.error("attention , probleme regex visa pour operation ligne %s", index)
                         self.logger.error(f"{row.detail}")
                         continue
@@ -245,10 +249,11 @@ class ImporterBoursorama(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                     continue
                 else:
                     self.logger.error("type inconnu ligne %s", index)
-            if error:
-                raise Exception("au moins une erreur")
-        return entries
+            self.logger.debug("cache categories: %s hits, %s misses", self.regles_cat.hits, self.regles_cat.misses)
+        if erreurs:
+            self.logger.error("au moins une erreur: %s ligne(s) en erreur", erreurs)
+        return erreurs
@@ -1,3 +1,4 @@
+import bisect
 import json
 
 # coding=utf-8
@@ -26,7 +27,7 @@ from fp_bc import utils
 from fp_bc import utils_bc
 
 
-def mapping_cat(cat_json_to_map: t.Union[str, t.List], list_categories: t.List[str]) -> str:
+def normalise_cat(cat_json_to_map: t.Union[str, t.List]) -> str:
     # capitalise
     if not isinstance(cat_json_to_map, (str)):
         cat_json_to_map = [c.capitalize() for c in cat_json_to_map]
@@ -37,6 +38,11 @@ def mapping_cat(cat_json_to_map: t.Union[str, t.List], list_categories: t.List[s
     temp = ''.join(c for c in unicodedata.normalize('NFD', temp) if unicodedata.category(c) != 'Mn')
     # efface espaces
     temp = temp.strip()
+    return temp
+
+
+def mapping_cat(cat_json_to_map: t.Union[str, t.List], list_categories: t.List[str]) -> str:
+    temp = normalise_cat(cat_json_to_map)
     if temp == "Ost":
         return "Expenses:OST"
     else:
@@ -46,9 +52,137 @@ def mapping_cat(cat_json_to_map: t.Union[str, t.List], list_categories: t.List[s
     raise Exception(f"{temp} inconnu")
 
 
+class CategoryIndex:
+    """equivalent de mapping_cat pour une liste de categories fixee.
+    les categories sont concatenees avec un separateur: le premier str.find tombe dans la premiere categorie
+    qui contient le texte, retrouvee par bisect sur les positions de debut"""
+
+    SEPARATEUR = "\x00"
+
+    def __init__(self, list_categories: t.List[str]) -> None:
+        self.list_categories = list_categories
+        self.texte = self.SEPARATEUR.join(list_categories)
+        self.debuts: t.List[int] = []
+        position = 0
+        for c in list_categories:
+            self.debuts.append(position)
+            position += len(c) + len(self.SEPARATEUR)
+        self.normalisations: t.Dict[t.Union[str, t.Tuple[str, ...]], str] = {}
+        self.resultats: t.Dict[str, str] = {}
+
+    def normalise(self, cat_json_to_map: t.Union[str, t.List]) -> str:
+        cle = cat_json_to_map if isinstance(cat_json_to_map, str) else tuple(cat_json_to_map)
+        try:
+            return self.normalisations[cle]
+        except KeyError:
+            temp = self.normalisations[cle] = normalise_cat(cat_json_to_map)
+            return temp
+
+    def chercher(self, temp: str) -> t.Optional[str]:
+        if self.SEPARATEUR in temp:
+            return next((c for c in self.list_categories if temp in c), None)
+        position = self.texte.find(temp)
+        if position < 0 or not self.list_categories:
+            return None
+        return self.list_categories[bisect.bisect_right(self.debuts, position) - 1]
+
+    def __call__(self, cat_json_to_map: t.Union[str, t.List]) -> str:
+        temp = self.normalise(cat_json_to_map)
+        try:
+            return self.resultats[temp]
+        except KeyError:
+            pass
+        if temp == "Ost":
+            categorie: t.Optional[str] = "Expenses:OST"
+        else:
+            categorie = self.chercher(temp)
+        if categorie is None:
+            raise Exception(f"{temp} inconnu")
+        self.resultats[temp] = categorie
+        return categorie
+
+
+class UuidIndex:
+    """ensemble des uuid deja presents dans le ledger.
+    s'il est persiste, le fichier est a cote du ledger et n'est valable que pour la meme taille et date de modification.
+    seuls les uuid du ledger sont persistes: ceux des operations extraites restent en memoire
+    tant qu'elles ne sont pas ecrites dans le ledger"""
+
+    def __init__(self, ledger: t.Optional[str] = None) -> None:
+        self.ledger = ledger
+        self.uuids: t.Set[str] = set()
+        self.extraits: t.Set[str] = set()
+        self.cle: t.Optional[t.List[int]] = None
+
+    @property
+    def fichier(self) -> t.Optional[str]:
+        if self.ledger is None:
+            return None
+        return f"{self.ledger}.uuid.json"
+
+    def cle_ledger(self) -> t.Optional[t.List[int]]:
+        if self.ledger is None or not os.path.exists(self.ledger):
+            return None
+        stat = os.stat(self.ledger)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def charger(self) -> bool:
+        """charge l'index persiste, renvoie False s'il n'existe pas ou si le ledger a change"""
+        fichier = self.fichier
+        cle = self.cle_ledger()
+        if fichier is None or cle is None or not os.path.exists(fichier):
+            return False
+        try:
+            with open(fichier, encoding="UTF-8") as f:
+                contenu = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if contenu.get("cle") != cle:
+            return False
+        self.uuids = set(contenu["uuids"])
+        self.cle = cle
+        return True
+
+    def construire(self, existing_entries: t.Iterable[utils_bc.bc_directives]) -> None:
+        """reconstruit l'index a partir des meta des transactions et des postings"""
+        uuids: t.Set[str] = set()
+        for entry in existing_entries:
+            if isinstance(entry, data.Transaction):
+                if "uuid" in entry.meta:
+                    uuids.add(entry.meta["uuid"])
+                for p in entry.postings:
+                    if p.meta is not None and "uuid" in p.meta:
+                        uuids.add(p.meta["uuid"])
+        self.uuids = uuids
+        self.cle = self.cle_ledger()
+
+    def sauver(self) -> None:
+        """persiste les uuid du ledger (sans ceux ajoutes par add)"""
+        fichier = self.fichier
+        if fichier is None or self.cle is None:
+            return
+        with open(fichier, "w", encoding="UTF-8") as f:
+            json.dump({"cle": self.cle, "uuids": sorted(self.uuids)}, f)
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self.uuids or uuid in self.extraits
+
+    def add(self, uuid: str) -> None:
+        """uuid extrait pendant ce run, non persiste"""
+        self.extraits.add(uuid)
+
+
 class Importer_myexp(importer.ImporterProtocol):
-    def __init__(self, mapping_comptes: t.Dict[str, str]) -> None:
+    # le resultat depend des uuid et des comptes du ledger: pas de cache d'extraction
+    utilise_existing_entries = True
+
+    def __init__(self, mapping_comptes: t.Dict[str, str], ledger: t.Optional[str] = None) -> None:
+        """
+        @param mapping_comptes: nom du compte dans l'export => compte beancount
+        @param ledger: si renseigne, l'index des uuid existants est persiste a cote de ce fichier
+        """
         self.mapping = mapping_comptes
+        self.ledger = ledger
 
     def name(self) -> str:
         # permet d'avoir deux comptes et de pouvoir les differenciers au niveau de la config
@@ -63,9 +197,16 @@ class Importer_myexp(importer.ImporterProtocol):
         return "generique"
 
     def extract(self, file: cache._FileMemo, existing_entries: t.Optional[t.List[utils_bc.bc_directives]] = None) -> t.List[utils_bc.bc_directives]:
+        entries, _ = utils_bc.collect(self.iter_extract(file, existing_entries))
+        return entries
+
+    def iter_extract(
+        self, file: cache._FileMemo, existing_entries: t.Optional[t.List[utils_bc.bc_directives]] = None
+    ) -> t.Generator[utils_bc.bc_directives, None, int]:
+        """renvoie les directives au fur et a mesure, puis le nombre d'operations en erreur"""
         list_categories: t.List[str] = list()
         list_comptes: t.List[str] = list()
-        uuid_existant: t.List[str] = list()
+        uuid_existant = UuidIndex(self.ledger)
         if existing_entries is not None:
             for entry in existing_entries:
                 if isinstance(entry, data.Open):
@@ -73,15 +214,12 @@ class Importer_myexp(importer.ImporterProtocol):
                         list_comptes.append(entry.account)
                     else:
                         list_categories.append(entry.account)
-                if isinstance(entry, data.Transaction):
-                    if "uuid" in entry.meta:
-                        uuid_existant.append(entry.meta["uuid"])
-                    for p in entry.postings:
-                        if p.meta is not None and "uuid" in p.meta:
-                            uuid_existant.append(p.meta["uuid"])
+            if not uuid_existant.charger():
+                uuid_existant.construire(existing_entries)
+                uuid_existant.sauver()
         logger = logging.getLogger(__file__)
-        entries: t.List[utils_bc.bc_directives] = list()
-        error = False
+        erreurs = 0
+        index_cat = CategoryIndex(list_categories)
         with open(file.name, encoding='UTF-8') as f:
             data_json = json.load(f)
         # a depkacer
@@ -105,7 +243,7 @@ class Importer_myexp(importer.ImporterProtocol):
                 try:
                     montant_releve = amount.Amount(utils.to_decimal(t_json["amount"]), currency)
                 except decimal.InvalidOperation:
-                    error = True
+                    erreurs += 1
                     logger.error(f"montant '{t_json['amount']}' invalide pour uuid  {t_json['uuid']}")
                     continue
                 if montant_releve.number is None:
@@ -149,8 +287,8 @@ class Importer_myexp(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     utils_bc.check_before_add(transac)
-                    entries.append(transac)
-                    uuid_existant.append(t_json["uuid"])
+                    yield transac
+                    uuid_existant.add(t_json["uuid"])
                     continue
                 else:
                     if "splits" not in t_json:
@@ -161,10 +299,10 @@ class Importer_myexp(importer.ImporterProtocol):
                             if tiers is None:
                                 tiers = "inconnu"
                         if "category" not in t_json:
-                            category = mapping_cat('inconnu', list_categories)
+                            category = index_cat('inconnu')
                             continue
                         else:
-                            category = mapping_cat(t_json["category"], list_categories)
+                            category = index_cat(t_json["category"])
                         posting_1 = data.Posting(
                             account=compte_name,
                             units=montant_releve,
@@ -196,8 +334,8 @@ class Importer_myexp(importer.ImporterProtocol):
                             postings=[posting_1, posting_2],
                         )
                         utils_bc.check_before_add(transac)
-                        entries.append(transac)
-                        uuid_existant.append(t_json["uuid"])
+                        yield transac
+                        uuid_existant.add(t_json["uuid"])
                         continue
                     else:
                         if "payee" not in t_json:
@@ -223,7 +361,7 @@ class Importer_myexp(importer.ImporterProtocol):
                             try:
                                 montant_releve_s = amount.Amount(utils.to_decimal(p_json["amount"]), currency)
                             except decimal.InvalidOperation:
-                                error = True
+                                erreurs += 1
                                 logger.error(f"montant '{p_json['amount']}' invalide pour uuid  {p_json['uuid']}")
                                 continue
                             except TypeError:
@@ -244,9 +382,9 @@ class Importer_myexp(importer.ImporterProtocol):
                                 if 'comment' in p_json:
                                     narration_l.append(p_json['comment'])
                                 try:
-                                    category = mapping_cat(p_json["category"], list_categories)
+                                    category = index_cat(p_json["category"])
                                 except KeyError:
-                                    category = mapping_cat("inconnu", list_categories)
+                                    category = index_cat("inconnu")
                             if not narration:
                                 narration = "/".join(narration_l)
                             posting_c = data.Posting(
@@ -258,7 +396,7 @@ class Importer_myexp(importer.ImporterProtocol):
                                 price=None,
                             )
                             liste_posting.append(posting_c)
-                            uuid_existant.append(p_json["uuid"])
+                            uuid_existant.add(p_json["uuid"])
                         if 'tags' in t_json:
                             tags = set(t_json['tags'])
                         transac = data.Transaction(
@@ -272,7 +410,9 @@ class Importer_myexp(importer.ImporterProtocol):
                             postings=liste_posting,
                         )
                         utils_bc.check_before_add(transac)
-                        entries.append(transac)
-                        uuid_existant.append(t_json["uuid"])
+                        yield transac
+                        uuid_existant.add(t_json["uuid"])
                         continue
-        return entries
+        if erreurs:
+            logger.error("au moins une erreur: %s operation(s) en erreur", erreurs)
+        return erreurs
@@ -13,8 +13,10 @@ from beancount.core import flags
 from beancount.core.number import MISSING
 from beancount.ingest import importer
 
-from fp_bc.utils import CsvUnicodeReader
+from fp_bc.utils import CsvFastReader
 from fp_bc import utils
+from fp_bc import rules
+from fp_bc import utils_bc
 
 import typing as t
 
@@ -47,6 +49,7 @@ class ImporterPB(importer.ImporterProtocol):
         cat_frais: str = "Expenses:Frais-bancaires",
     ):
         self.tiers_update = tiers_update
+        self.regles_tiers = rules.TiersRules(tiers_update)
         self.tiers_cat = tiers_cat
         self.logger = logging.getLogger(__file__)  # pylint: disable=W0612
         self.currency = currency
@@ -54,6 +57,7 @@ class ImporterPB(importer.ImporterProtocol):
         self.account_cash = account_cash
         self.cat_default = cat_default
         self.cat_frais = cat_frais
+        self.regles_cat = rules.CatRules(tiers_cat, cat_default)
 
         regex = (
             re.compile(
@@ -87,18 +91,10 @@ class ImporterPB(importer.ImporterProtocol):
         return self.account_root
 
     def cat(self, tiers: str) -> str:
-        if self.tiers_cat is not None:
-            for regle_cat in self.tiers_cat:
-                if re.findall(regle_cat[0], tiers, re.UNICODE | re.IGNORECASE):
-                    return regle_cat[1]
-        return self.cat_default
+        return self.regles_cat.resoudre(tiers)
 
     def tiers_update_verifie(self, tiers: str) -> str:
-        if self.tiers_update is not None:
-            for regle_tiers in self.tiers_update:
-                if re.search(regle_tiers[0], tiers, re.UNICODE | re.IGNORECASE):
-                    tiers = regle_tiers[1]
-        return tiers
+        return self.regles_tiers.appliquer(tiers)
 
     def check_before_add(self, entry: data.Transaction) -> None:
         try:
@@ -113,14 +109,49 @@ class ImporterPB(importer.ImporterProtocol):
                 pprint.pformat(entry),
             )
 
-    def extract(self, file: t.IO, existing_entries: t.Optional[t.List[bc_directives]] = None) -> t.List[bc_directives]:
+    def solde(self, filename: str, entete: t.List[str]) -> t.Optional[data.Balance]:
+        """renvoie le solde indique dans l'entete du fichier, date du lendemain de la date du nom de fichier"""
+        row = next(CsvFastReader(iter(entete), champs=["name", "valeur"], ligne_saut=5, champ_detail="detail"), None)
+        if row is None:
+            self.logger.warning(f"{filename}: pas de solde dans l'entete")
+            return None
+        date = utils.strpdate(
+            re.findall(
+                r"PB_Umsatzauskunft_KtoNr\d+_(\d\d-\d\d-\d\d\d\d)_\d+.csv",
+                filename,
+                re.UNICODE | re.IGNORECASE,
+            )[0].strip(),
+            "%d-%m-%Y",
+        )
+        montant = utils.to_decimal(row.row["valeur"][:-2], thousand_point=True)
+        meta = data.new_metadata(filename, 1)
+        return data.Balance(
+            meta,
+            date + datetime.timedelta(days=1),
+            self.account_root,
+            amount.Amount(montant, self.currency),
+            None,
+            None,
+        )
+
+    def extract(self, file: t.IO, existing_entries: t.Optional[t.List[bc_directives]] = None) -> t.Optional[t.List[bc_directives]]:
+        entries, erreurs = utils_bc.collect(self.iter_extract(file, existing_entries))
+        if not erreurs:
+            return entries
+        else:
+            return None
+
+    def iter_extract(self, file: t.IO, existing_entries: t.Optional[t.List[bc_directives]] = None) -> t.Generator[bc_directives, None, int]:
+        """renvoie les directives au fur et a mesure de la lecture du fichier, puis le nombre de lignes en erreur"""
         # Open the CSV file and create directives.
-        entries = []
-        error = False
+        erreurs = 0
         with open(file.name, "r", encoding="windows-1250") as fichier:
+            # l'entete contient le solde: on le lit une seule fois puis on reprend les memes lignes pour les operations
+            entete, lignes = utils.lire_entete(fichier, 8)
+            solde = self.solde(file.name, entete)
             for index, row in enumerate(
-                CsvUnicodeReader(
-                    fichier,
+                CsvFastReader(
+                    lignes,
                     champs=[
                         "date",
                         "valeur",
@@ -146,7 +177,7 @@ class ImporterPB(importer.ImporterProtocol):
                         moyen = nom_moyen
                         regex = regle_moyen[1]
                 if moyen == MISSING:
-                    error = True
+                    erreurs += 1
                     self.logger.error(
                         "attention , moyen %s inconnu pour operation ligne %s",
                         row.row["moyen"],
@@ -176,7 +207,7 @@ class ImporterPB(importer.ImporterProtocol):
                         date = utils.strpdate(f"{retour.group('date')}.{annee}", "%d.%m.%Y")
                         desc = retour.group("desc")
                     else:
-                        error = True
+                        erreurs += 1
                         self.logger.error("attention , probleme regex dans pb pour operation ligne %s", index)
                         continue
                     tiers = "Virement"
@@ -199,7 +230,7 @@ class ImporterPB(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                 if moyen == "retrait_avec_frais":
                     moyen_ok = True
                     flag = flags.FLAG_TRANSFER
@@ -211,7 +242,7 @@ class ImporterPB(importer.ImporterProtocol):
                         date = utils.strpdate(retour.group("date"), "%Y-%m-%d")
                         desc = retour.group("desc")
                     else:
-                        error = True
+                        erreurs += 1
                         self.logger.error("attention , probleme regex pour operation ligne %s", index)
                         continue
                     tiers = "Virement"
@@ -275,7 +306,7 @@ class ImporterPB(importer.ImporterProtocol):
                             links=data.EMPTY_SET,
                             postings=[posting_1, posting_2],
                         )
-                    entries.append(transac)
+                    yield transac
                 if moyen == "Virement automatique":
                     moyen_ok = True
                     flag = flags.FLAG_WARNING
@@ -302,7 +333,7 @@ class ImporterPB(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                 if moyen == "Virement_recu":
                     moyen_ok = True
                     flag = flags.FLAG_WARNING
@@ -329,7 +360,7 @@ class ImporterPB(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                 if moyen == "vpay":
                     moyen_ok = True
                     flag = flags.FLAG_WARNING
@@ -342,7 +373,7 @@ class ImporterPB(importer.ImporterProtocol):
                         tiers = self.tiers_update_verifie(retour.group("tiers"))
                         desc = retour.group("desc")
                     else:
-                        error = True
+                        erreurs += 1
                         self.logger.error("attention , probleme regex pour operation ligne %s", index)
                         continue
                     cpt2 = self.cat(tiers)
@@ -407,7 +438,7 @@ class ImporterPB(importer.ImporterProtocol):
                             postings=[posting_1, posting_2],
                         )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                 if moyen == "Carte Visa":
                     moyen_ok = True
                     flag = flags.FLAG_WARNING
@@ -418,7 +449,7 @@ class ImporterPB(importer.ImporterProtocol):
                     if retour:
                         date_visa = utils.strpdate(f"{retour.group('date')}", "%d.%m.%y")
                     else:
-                        error = True
+                        erreurs += 1
                         self.logger.error("attention , probleme regex pour operation ligne %s", index)
                         continue
                     tiers = "Virement"
@@ -441,8 +472,8 @@ class ImporterPB(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
-                    entries.append(
+                    yield transac
+                    yield (
                         data.Balance(
                             meta,
                             date_visa + datetime.timedelta(days=1),
@@ -477,7 +508,7 @@ class ImporterPB(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                 if moyen == "prelevement":
                     moyen_ok = True
                     date = utils.strpdate(row.row["date"], "%d.%m.%Y")
@@ -489,7 +520,7 @@ class ImporterPB(importer.ImporterProtocol):
                     if retour:
                         desc = retour.group("desc")
                     else:
-                        error = True
+                        erreurs += 1
                         self.logger.error("attention , probleme regex pour operation ligne %s", index)
                         continue
                     posting_2 = data.Posting(
@@ -511,7 +542,7 @@ class ImporterPB(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                 if moyen == "Virement":
                     moyen_ok = True
                     date = utils.strpdate(row.row["date"], "%d.%m.%Y")
@@ -538,37 +569,13 @@ class ImporterPB(importer.ImporterProtocol):
                         postings=[posting_1, posting_2],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                 if not moyen_ok:
-                    error = True
+                    erreurs += 1
                     self.logger.error("moyen %s non implementé", moyen)
-        with open(file.name, "r", encoding="windows-1250") as fichier:
-            for index, row in enumerate(
-                CsvUnicodeReader(fichier, champs=["name", "valeur"], ligne_saut=5, champ_detail="detail"),
-                6,
-            ):
-                date = utils.strpdate(
-                    re.findall(
-                        r"PB_Umsatzauskunft_KtoNr\d+_(\d\d-\d\d-\d\d\d\d)_\d+.csv",
-                        fichier.name,
-                        re.UNICODE | re.IGNORECASE,
-                    )[0].strip(),
-                    "%d-%m-%Y",
-                )
-                montant = utils.to_decimal(row.row["valeur"][:-2], thousand_point=True)
-                meta = data.new_metadata(file.name, 1)
-                entries.append(
-                    data.Balance(
-                        meta,
-                        date + datetime.timedelta(days=1),
-                        self.account_root,
-                        amount.Amount(montant, self.currency),
-                        None,
-                        None,
-                    )
-                )
-                break
-        if not error:
-            return entries
-        else:
-            return None
+        self.logger.debug("cache categories: %s hits, %s misses", self.regles_cat.hits, self.regles_cat.misses)
+        if solde is not None:
+            yield solde
+        if erreurs:
+            self.logger.error("au moins une erreur: %s ligne(s) en erreur", erreurs)
+        return erreurs
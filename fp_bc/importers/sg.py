@@ -14,6 +14,8 @@ from beancount.ingest import importer
 from beancount.ingest import cache
 
 from fp_bc import utils
+from fp_bc import rules
+from fp_bc import utils_bc
 
 
 __version__ = "2.0.0"
@@ -54,6 +56,7 @@ class ImporterSG(importer.ImporterProtocol):
         self.account_id = account_id
         self.account_cash = account_cash
         self.tiers_update = tiers_update
+        self.regles_tiers = rules.TiersRules(tiers_update)
         self.raise_exc = raise_exc
 
     def name(self) -> str:
@@ -80,34 +83,38 @@ class ImporterSG(importer.ImporterProtocol):
             self.logger.error(f"error , problem assertion {pprint.pformat(exp)} in the transaction {pprint.pformat(entry)}")
 
     def tiers_update_verifie(self, tiers: str) -> str:
-        if self.tiers_update:
-            for regle_tiers in self.tiers_update:
-                if re.search(regle_tiers[0], tiers, re.UNICODE | re.IGNORECASE):
-                    tiers = regle_tiers[1]
+        tiers = self.regles_tiers.appliquer(tiers)
         tiers = tiers.capitalize()
         tiers = tiers.strip()
         return tiers
 
     def extract(self, file: cache._FileMemo, existing_entries: t.Optional[t.List[bc_directives]] = None) -> t.List[bc_directives]:
+        entries, erreurs = utils_bc.collect(self.iter_extract(file, existing_entries))
+        if erreurs:
+            raise Exception("au moins une erreur")
+        return entries
+
+    def iter_extract(self, file: cache._FileMemo, existing_entries: t.Optional[t.List[bc_directives]] = None) -> t.Generator[bc_directives, None, int]:
+        """renvoie les directives au fur et a mesure de la lecture du fichier, puis le nombre de lignes en erreur"""
         # Open the CSV file and create directives.
-        entries: t.List[bc_directives] = []
-        error = False
+        erreurs = 0
         champs1 = ["date", "libelle", "detail", "montant", "devise"]
         champs2 = ["date", "detail", "montant", "devise", "libelle"]
         with open(file.name, "r", encoding="windows-1252") as fichier:
+            # determination du type de fichier sur les premieres lignes, lues une seule fois
+            entete, lignes = utils.lire_entete(fichier, 3)
             champs = champs1
-            # determination du type de fichier ?
-            file_open = utils.CsvUnicodeReader(fichier, champs=champs, ligne_saut=2, champ_detail="detail")
-            row = next(file_open)
+            row = next(utils.CsvFastReader(iter(entete), champs=champs, ligne_saut=2, champ_detail="detail"), None)
+            if row is None:
+                self.logger.error(f"{file.name}: pas de ligne d'operation apres l'entete, fichier ignore")
+                return erreurs
             if row["montant"] == "EUR":
                 champs = champs2
-                file_open = utils.CsvUnicodeReader(fichier, champs=champs2, ligne_saut=2, champ_detail="detail")
-                row = next(file_open)
+                row = next(utils.CsvFastReader(iter(entete), champs=champs2, ligne_saut=2, champ_detail="detail"))
             if row["devise"] != "EUR":
                 raise Exception("attention la monnaie n'est pas en euro")
-        # une fois decide, on peut lire le fichier
-        with open(file.name, "r", encoding="windows-1252") as fichier:
-            file_open = utils.CsvUnicodeReader(fichier, champs=champs, ligne_saut=2, champ_detail="detail")
+            # une fois decide, on lit le fichier en reprenant les lignes deja lues
+            file_open = utils.CsvFastReader(lignes, champs=champs, ligne_saut=2, champ_detail="detail")
             for index, row in enumerate(
                 file_open,
                 start=4
@@ -122,7 +129,7 @@ class ImporterSG(importer.ImporterProtocol):
                     montant = utils.to_decimal(row.row["montant"])
                     montant_releve = amount.Amount(montant, self.currency)
                 except decimal.InvalidOperation:
-                    error = True
+                    erreurs += 1
                     if self.raise_exc:
                         raise Exception(f"montant '{row.row['montant']}' invalide pour operation ligne {index}")
                     else:
@@ -137,7 +144,7 @@ class ImporterSG(importer.ImporterProtocol):
                             raise Exception(f"attention , probleme regex_retrait pour operation ligne {index}")
                         else:
                             self.logger.error(f"attention , probleme regex_retrait pour operation ligne {index}")
-                            error = True
+                            erreurs += 1
                             continue
                     posting_1 = data.Posting(account=self.account_root, units=montant_releve, cost=None, flag=None, meta=None, price=None,)
                     if self.account_cash:
@@ -179,7 +186,7 @@ class ImporterSG(importer.ImporterProtocol):
                             postings=[posting_1, ],
                         )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                     continue
                 # virement interne
                 if "GENERATION VIE" in row.detail:
@@ -216,7 +223,7 @@ class ImporterSG(importer.ImporterProtocol):
                         links=links,
                         postings=[posting_1, posting_2],
                     )
-                    entries.append(transac)
+                    yield transac
                     continue
                 if row.in_detail(r"^CARTE \w\d\d\d\d(?! RETRAIT)"):  # cas general de la visa
                     reg_visa = r"(?:CARTE \w\d\d\d\d) (?:REMBT )?(?P<date>\d\d\/\d\d) (?P<desc>.*?)(?:\d+,\d\d|COMMERCE ELECTRONIQUE|$|\s\d+IOPD)"
@@ -224,14 +231,14 @@ class ImporterSG(importer.ImporterProtocol):
                     if retour:
                         tiers = self.tiers_update_verifie(retour.group("desc"))
                         if not tiers:
-                            error = True
+                            erreurs += 1
                             if self.raise_exc:
                                 raise Exception("attention , probleme regex visa pour operation ligne %s", index)
                             self.logger.error("attention , probleme regex visa pour operation ligne %s", index)
                             self.logger.error(f"{row.detail}")
                             continue
                     else:
-                        error = True
+                        erreurs += 1
                         if self.raise_exc:
                             raise Exception("attention , probleme regex visa pour operation ligne %s", index)
                         self.logger.error("attention , probleme regex visa pour operation ligne %s", index)
@@ -249,7 +256,7 @@ class ImporterSG(importer.ImporterProtocol):
                         postings=[posting_1, ],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
+                    yield transac
                 else:
                     #  c'est un virement non transfert
                     regex_virement = r"VIR EUROPEEN EMIS \s* LOGITEL POUR: (.*?)(?: \d\d \d\d BQ \d+ CPT \S+)*? REF:"
@@ -258,7 +265,7 @@ class ImporterSG(importer.ImporterProtocol):
                         tiers_1 = recherche.group(1)
                         tiers = self.tiers_update_verifie(tiers_1)
                     if "VIR EUROPEEN EMIS" in row.detail and not tiers:
-                        error = True
+                        erreurs += 1
                         if self.raise_exc:
                             raise Exception(f"attention , probleme regex pour operation ligne {index}")
                         self.logger.error(f"attention , probleme regex pour operation ligne {index}")
@@ -270,7 +277,7 @@ class ImporterSG(importer.ImporterProtocol):
                             tiers_1 = tiers_1.strip()
                             tiers = self.tiers_update_verifie(tiers_1)
                         else:
-                            error = True
+                            erreurs += 1
                             if self.raise_exc:
                                 raise Exception(f"attention , probleme regex pour operation ligne {index}")
                             self.logger.error(f"attention , probleme regex pour operation ligne {index}")
@@ -301,7 +308,7 @@ class ImporterSG(importer.ImporterProtocol):
                         postings=[data.Posting(account=self.account_root, units=montant_releve, cost=None, flag=None, meta=None, price=None,)],
                     )
                     self.check_before_add(transac)
-                    entries.append(transac)
-        if error:
-            raise Exception("au moins une erreur")
-        return entries
+                    yield transac
+        if erreurs:
+            self.logger.error("au moins une erreur: %s ligne(s) en erreur", erreurs)
+        return erreurs
@@ -1,23 +1,129 @@
 """This plugin synthesizes Price directives for all Postings with a price or
 directive or if it is an augmenting posting, has a cost directive.
+
+The plugin accepts a config string, a Python dict literal, e.g.
+  plugin "fp_bc.plugins.price_plugin" "{'duplicates': 'last'}"
+
+At most one price is synthesized per (date, currency, quote currency), and
+none when an explicit price exists for it. 'duplicates' chooses which one
+is kept when several postings price the same pair on the same day:
+  'first' (default), 'last', or 'vwap', the average weighted by the units.
+
+The postings prices are synthesized for can be restricted, e.g.
+  "{'commodities': ['HOOL', 'FR0010315770'], 'accounts': ['Assets:Broker'], 'since': '2015-01-01'}"
+  'commodities': only these commodities (the units currency) are priced.
+  'exclude_commodities': these commodities are never priced.
+  'accounts': only the postings to these accounts or their sub-accounts.
+  'since': no price is synthesized before this ISO date.
+Excluded postings are neither booked nor priced. Postings before 'since'
+are still booked, since they decide whether later ones reduce a lot.
 """
 __copyright__ = "Copyright (C) 2015-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import ast
 import collections
+import datetime
+import logging
 
 from beancount.core.data import Transaction
 from beancount.core import data
 from beancount.core import amount
-from beancount.core import inventory
 
 __plugins__ = ("add_implicit_prices",)
 
 
 ImplicitPriceError = collections.namedtuple("ImplicitPriceError", "source message entry")
 
+# Policies for the prices synthesized for the same pair on the same date.
+DUPLICATES = ("first", "last", "vwap")
+
+class Scope:
+    """The postings prices are synthesized for, from the config options."""
+
+    __slots__ = ("commodities", "exclude_commodities", "accounts", "since", "currency_cache", "account_cache")
+
+    def __init__(self, commodities=None, exclude_commodities=(), accounts=None, since=None):
+        self.commodities = frozenset(commodities) if commodities is not None else None
+        self.exclude_commodities = frozenset(exclude_commodities)
+        self.accounts = tuple(accounts) if accounts is not None else None
+        self.since = since
+        self.currency_cache = {}
+        self.account_cache = {}
+
+    @classmethod
+    def from_options(cls, options):
+        """Return the Scope of the options, or None if they select every posting."""
+        names = ("commodities", "exclude_commodities", "accounts", "since")
+        if not any(name in options for name in names):
+            return None
+        since = options.get("since")
+        return cls(
+            options.get("commodities"),
+            options.get("exclude_commodities", ()),
+            options.get("accounts"),
+            datetime.date.fromisoformat(since) if since is not None else None,
+        )
+
+    def includes(self, account, currency):
+        """Return True if the postings of currency units to account are priced."""
+        included = self.currency_cache.get(currency)
+        if included is None:
+            included = self.currency_cache[currency] = (
+                self.commodities is None or currency in self.commodities
+            ) and currency not in self.exclude_commodities
+        if not included or self.accounts is None:
+            return included
+        included = self.account_cache.get(account)
+        if included is None:
+            included = self.account_cache[account] = any(
+                account == prefix or account.startswith(prefix + ":") for prefix in self.accounts
+            )
+        return included
+
+
+def parse_config(config):
+    """Parse the plugin config string.
+
+    Args:
+      config: None or a string holding a Python dict literal.
+    Returns:
+      A dict of options, and a list of errors.
+    """
+    if not config:
+        return {}, []
+    meta = data.new_metadata("<price_plugin>", 0)
+    try:
+        options = ast.literal_eval(config)
+        if not isinstance(options, dict):
+            raise ValueError("not a dict")
+    except (ValueError, SyntaxError) as exc:
+        return {}, [ImplicitPriceError(meta, "Invalid config {!r}: {}".format(config, exc), None)]
+    errors = []
+    if options.get("duplicates", DUPLICATES[0]) not in DUPLICATES:
+        errors.append(
+            ImplicitPriceError(
+                meta, "Invalid duplicates policy {!r}, expected one of {}".format(options["duplicates"], DUPLICATES), None
+            )
+        )
+        del options["duplicates"]
+    for name in ("commodities", "exclude_commodities", "accounts"):
+        value = options.get(name)
+        if value is not None and (
+            not isinstance(value, (list, tuple, set)) or not all(isinstance(item, str) for item in value)
+        ):
+            errors.append(ImplicitPriceError(meta, "Invalid {} {!r}, expected a list of strings".format(name, value), None))
+            del options[name]
+    if "since" in options:
+        try:
+            datetime.date.fromisoformat(options["since"])
+        except (TypeError, ValueError):
+            errors.append(ImplicitPriceError(meta, "Invalid since {!r}, expected a YYYY-MM-DD date".format(options["since"]), None))
+            del options["since"]
+    return options, errors
+
 
-def add_implicit_prices(entries, unused_options_map):
+def add_implicit_prices(entries, unused_options_map, config=None):
     """Insert implicitly defined prices from Transactions.
 
     Explicit price entries are simply maintained in the output list. Prices from
@@ -27,37 +133,156 @@ def add_implicit_prices(entries, unused_options_map):
     Args:
       entries: A list of directives. We're interested only in the Transaction instances.
       unused_options_map: A parser options dict.
+      config: The plugin config string, see parse_config().
     Returns:
       A list of entries, possibly with more Price entries than before, and a
       list of errors.
     """
-    new_entries = []
-    errors = []
+    options, errors = parse_config(config)
+    duplicates = options.get("duplicates", DUPLICATES[0])
+    scope = Scope.from_options(options)
+    new_entries, synth_errors, report = synthesize_prices(entries, duplicates, scope)
+    log_report(report, duplicates)
+    return new_entries, errors + synth_errors
 
-    # A dict of (date, currency, cost-currency) to price entry.
-    new_price_entry_map = {}
-    for entry in entries:
-        if isinstance(entry, data.Price):
-            key = (entry.date, entry.currency)
-            try:
-                new_price_entry_map[key]
-            except KeyError:
-                new_price_entry_map[key] = entry
-    balances = collections.defaultdict(inventory.Inventory)
+
+def log_report(report, duplicates):
+    if report["collapsed"]:
+        logging.getLogger("price_plugin").info(
+            "{} duplicate prices collapsed (policy '{}')".format(report["collapsed"], duplicates)
+        )
+
+
+def synthesize_prices(entries, duplicates=DUPLICATES[0], scope=None):
+    """Synthesize the implicit prices, see iter_prices().
+
+    Returns:
+      The new list of entries, a list of errors and a report: a dict with the
+      number of prices collapsed under 'collapsed'.
+    """
+    report = {"collapsed": 0}
+    new_entries = list(iter_prices(entries, duplicates, report, scope))
+    return new_entries, [], report
+
+
+def merge_prices(group, duplicates):
+    """Return the Price entry for the prices synthesized for one pair on one date.
+
+    Args:
+      group: A list of (transaction, units, price), in the order of the entries.
+      duplicates: 'last' or 'vwap'.
+    Returns:
+      The last price, or the average of the prices weighted by the absolute
+      units, at the precision of the most precise price. Its metadata is the
+      one of the transaction of the last, respectively first, price.
+    """
+    if duplicates == "last":
+        entry, units, price = group[-1]
+    else:
+        entry, units, price = group[0]
+        weight = sum(abs(units.number) for _, units, _ in group)
+        if weight:
+            number = sum(abs(units.number) * price.number for _, units, price in group) / weight
+            precision = min((price.number for _, _, price in group), key=lambda value: value.as_tuple().exponent)
+            price = amount.Amount(number.quantize(precision), price.currency)
+    meta = data.new_metadata(entry.meta["filename"], entry.meta["lineno"])
+    return data.Price(meta, entry.date, units.currency, price)
+
+
+def flush_day(day_entries, day_groups, duplicates):
+    """Return the output of a date: merge the duplicate prices and drop the replaced ones."""
+    for index, group in day_groups.items():
+        if len(group) > 1 and day_entries[index] is not None:
+            day_entries[index] = merge_prices(group, duplicates)
+    return [entry for entry in day_entries if entry is not None]
+
+
+def iter_prices(entries, duplicates=DUPLICATES[0], report=None, scope=None):
+    """Yield the entries with the implicit prices inserted after their transaction.
+
+    The output is buffered one date at a time only: at most one price is
+    synthesized per (date, currency, quote currency), chosen by duplicates,
+    and an explicit price entry replaces the price synthesized earlier on
+    its date with the same key.
+
+    Args:
+      entries: An iterable of directives, sorted by date.
+      duplicates: One of DUPLICATES.
+      report: If not None, a dict that receives the number of collapsed
+        prices under 'collapsed'.
+      scope: If not None, the Scope of the postings booked and priced.
+    Yields:
+      The directives of entries and the new Price entries.
+    """
+    # The output of the current date, and a dict of the (currency, quote
+    # currency) priced on that date to the index of the synthesized price
+    # entry in day_entries, or to -1 for an explicit price entry.
+    day_entries = []
+    day = None
+    day_prices = {}
+    # Unless the first price is kept, a dict of index in day_entries to the
+    # (transaction, units, price) synthesized for that pair on that date.
+    day_groups = {}
+    keep_first = duplicates == DUPLICATES[0]
+    rewrite = False
+    collapsed = 0
+    # Per-account lots held at cost, a dict of (currency, cost) to number.
+    # Postings without a cost are not tracked: they cannot reduce a lot.
+    balances = collections.defaultdict(dict)
+    since = scope.since if scope is not None else None
+    priced = True
     for entry in entries:
-        # Always replicat    e the existing entries.
-        new_entries.append(entry)
+        if entry.date != day:
+            if rewrite:
+                day_entries = flush_day(day_entries, day_groups, duplicates)
+                rewrite = False
+            yield from day_entries
+            day_entries = []
+            day_prices.clear()
+            day_groups.clear()
+            day = entry.date
+            priced = since is None or day >= since
+        # Always replicate the existing entries.
+        day_entries.append(entry)
         if isinstance(entry, Transaction):
+            # The prices synthesized from a transaction share their metadata.
+            meta = None
             # Inspect all the postings in the transaction.
             for posting in entry.postings:
-                if posting.cost is None and posting.price is None:
-                    continue
-                price_entry = None
                 units = posting.units
                 cost = posting.cost
-                # Check if the position is matching against an existing
-                # position.
-                _, booking = balances[posting.account].add_position(posting)
+                if cost is None and posting.price is None:
+                    continue
+                # An excluded commodity or account is not booked either: the
+                # lots of the others are keyed on a different currency or
+                # are in a different account.
+                if scope is not None and not scope.includes(posting.account, units.currency):
+                    continue
+                if cost is None:
+                    # A conversion: its price is emitted whatever the
+                    # balance, and it never matches a lot held at cost.
+                    if not priced:
+                        continue
+                    is_reduced = False
+                else:
+                    # Check if the position is matching against an existing
+                    # lot, as Inventory.add_position() would.
+                    lots = balances[posting.account]
+                    key = (units.currency, cost)
+                    number = lots.get(key)
+                    if number is None:
+                        is_reduced = False
+                        if units.number:
+                            lots[key] = units.number
+                    else:
+                        is_reduced = (number >= 0) != (units.number >= 0)
+                        number += units.number
+                        if number:
+                            lots[key] = number
+                        else:
+                            del lots[key]
+                if not priced:
+                    continue
                 # Add prices when they're explicitly specified on a posting. An
                 # explicitly specified price may occur in a conversion, e.g.
                 #      Assets:Account    100 USD @ 1.10 CAD
@@ -65,46 +290,43 @@ def add_implicit_prices(entries, unused_options_map):
                 # underlying instrument, e.g.
                 #      Assets:Account    100 HOOL {564.20} @ {581.97} USD
                 if posting.price is not None:
-                    meta = data.new_metadata(entry.meta["filename"], entry.meta["lineno"])
-                    price_entry = data.Price(meta, entry.date, units.currency, posting.price)
+                    price = posting.price
                 # Add costs, when we're not matching against an existing
                 # position. This happens when we're just specifying the cost,
                 # e.g.
                 #      Assets:Account    100 HOOL {564.20}
+                elif not is_reduced:
+                    price = amount.Amount(cost.number, cost.currency)
                 else:
-                    if cost is not None and booking != inventory.Booking.REDUCED:
-                        meta = data.new_metadata(entry.meta["filename"], entry.meta["lineno"])
-                        price_entry = data.Price(
-                            meta,
-                            entry.date,
-                            units.currency,
-                            amount.Amount(cost.number, cost.currency),
-                        )
-                if price_entry is not None:
-                    key = (price_entry.date, price_entry.currency)
-                    try:
-                        new_price_entry_map[key]
-                        # Do not fail for now. We still have many valid use
-                        # cases of duplicate prices on the same date, for
-                        # example, stock splits, or trades on two dates with
-                        # two separate reported prices. We need to figure out a
-                        # more elegant solution for this in the long term.
-                        # Keeping both for now. We should ideally not use the
-                        # number in the de-dup key above.
-                        #
-                        # dup_entry = new_price_entry_map[key]
-                        # if price_entry.amount.number == dup_entry.amount.number:
-                        #     # Skip duplicates.
-                        #     continue
-                        # else:
-                        #     errors.append(
-                        #         ImplicitPriceError(
-                        #             entry.meta,
-                        #             "Duplicate prices for {} on {}".format(entry,
-                        #                                                    dup_entry),
-                        #             entry))
-                    except KeyError:
-                        new_price_entry_map[key] = price_entry
-                        new_entries.append(price_entry)
-
-    return new_entries, errors
+                    continue
+                # Duplicate prices on the same date are valid, for example
+                # stock splits, or several trades on the same day: they are
+                # collapsed into one according to the duplicates policy.
+                key = (units.currency, price.currency)
+                index = day_prices.get(key)
+                if index is not None:
+                    collapsed += 1
+                    if index >= 0 and not keep_first:
+                        day_groups[index].append((entry, units, price))
+                        rewrite = True
+                    continue
+                index = day_prices[key] = len(day_entries)
+                if not keep_first:
+                    day_groups[index] = [(entry, units, price)]
+                if meta is None:
+                    meta = data.new_metadata(entry.meta["filename"], entry.meta["lineno"])
+                day_entries.append(data.Price(meta, entry.date, units.currency, price))
+        elif isinstance(entry, data.Price):
+            key = (entry.currency, entry.amount.currency)
+            index = day_prices.get(key, -1)
+            if index >= 0:
+                day_entries[index] = None
+                collapsed += 1
+                rewrite = True
+            day_prices[key] = -1
+
+    if rewrite:
+        day_entries = flush_day(day_entries, day_groups, duplicates)
+    yield from day_entries
+    if report is not None:
+        report["collapsed"] = collapsed
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""moteur de regles compile pour la normalisation des tiers"""
+
+import collections
+import functools
+import re
+import typing as t
+
+try:
+    from re import _parser as sre_parse  # type: ignore[attr-defined]
+except ImportError:  # pragma: no cover
+    import sre_parse  # type: ignore[no-redef]
+
+FLAGS = re.UNICODE | re.IGNORECASE
+METACARACTERES = frozenset(".^$*+?{}[]\\|()")
+# longueur minimale d'un litteral extrait d'une regexp pour servir de prefiltre
+LONGUEUR_MIN_PREFILTRE = 2
+
+
+@functools.lru_cache(maxsize=None)
+def _plier(c: str) -> str:
+    """renvoie le caractere ascii minuscule equivalent a c pour re.IGNORECASE, sinon c en minuscule"""
+    if c.isascii():
+        return c.lower()
+    for lettre in "abcdefghijklmnopqrstuvwxyz":
+        if re.fullmatch(lettre, c, FLAGS):
+            return lettre
+    bas = c.lower()
+    return bas if len(bas) == 1 else c
+
+
+class _TablePliage(dict):
+    """table pour str.translate qui calcule le pliage des caracteres a la demande"""
+
+    def __missing__(self, code: int) -> str:
+        valeur = self[code] = _plier(chr(code))
+        return valeur
+
+
+_TABLE_PLIAGE = _TablePliage((code, chr(code).lower()) for code in range(128))
+
+
+def plier(texte: str) -> str:
+    """met le texte sous la forme utilisee par l'automate.
+    un litteral ascii est trouve dans le texte plie si et seulement si re.search le trouve avec re.IGNORECASE"""
+    if texte.isascii():
+        return texte.lower()
+    return texte.translate(_TABLE_PLIAGE)
+
+
+def est_litteral(motif: str) -> bool:
+    """renvoie True si le motif ne contient aucun metacaractere et peut aller directement dans l'automate"""
+    return bool(motif) and motif.isascii() and not METACARACTERES.intersection(motif)
+
+
+def prefiltre(motif: str) -> t.Optional[str]:
+    """renvoie le plus long litteral obligatoire d'une regexp (plie), ou None si aucun n'est exploitable"""
+    try:
+        sequence = sre_parse.parse(motif, FLAGS)
+    except re.error:
+        return None
+    meilleur = ""
+    courant: t.List[str] = []
+    for op, valeur in list(sequence) + [(None, None)]:
+        if op is sre_parse.LITERAL and chr(valeur).isascii():
+            courant.append(chr(valeur))
+            continue
+        if len(courant) > len(meilleur):
+            meilleur = "".join(courant)
+        courant = []
+    if len(meilleur) < LONGUEUR_MIN_PREFILTRE:
+        return None
+    return meilleur.lower()
+
+
+def _combinable(motif: str) -> bool:
+    """renvoie True si le motif peut etre integre dans une regexp combinee sans changer de sens"""
+    try:
+        # les drapeaux globaux en ligne, ex (?x), ne sont acceptes qu'en tete de regexp
+        re.compile(f"(?:{motif})", FLAGS)
+        return sre_parse.parse(motif, FLAGS).state.groups == 1
+    except re.error:
+        return False
+
+
+class AhoCorasick:
+    """automate multi-motifs (Aho-Corasick) qui renvoie les identifiants des motifs presents dans un texte"""
+
+    __slots__ = ("transitions", "echecs", "sorties")
+
+    def __init__(self, motifs: t.Iterable[t.Tuple[str, int]]) -> None:
+        self.transitions: t.List[t.Dict[str, int]] = [{}]
+        self.echecs: t.List[int] = [0]
+        self.sorties: t.List[t.Tuple[int, ...]] = [()]
+        sorties: t.List[t.List[int]] = [[]]
+        for motif, ident in motifs:
+            etat = 0
+            for c in motif:
+                suivant = self.transitions[etat].get(c)
+                if suivant is None:
+                    suivant = len(self.transitions)
+                    self.transitions[etat][c] = suivant
+                    self.transitions.append({})
+                    self.echecs.append(0)
+                    sorties.append([])
+                etat = suivant
+            sorties[etat].append(ident)
+        # construction des liens d'echec en largeur
+        file_attente = list(self.transitions[0].values())
+        for etat in file_attente:
+            for c, suivant in self.transitions[etat].items():
+                file_attente.append(suivant)
+                echec = self.echecs[etat]
+                while echec and c not in self.transitions[echec]:
+                    echec = self.echecs[echec]
+                cible = self.transitions[echec].get(c, 0)
+                self.echecs[suivant] = cible if cible != suivant else 0
+                sorties[suivant].extend(sorties[self.echecs[suivant]])
+        self.sorties = [tuple(s) for s in sorties]
+
+    def chercher(self, texte: str) -> t.Set[int]:
+        """renvoie l'ensemble des identifiants des motifs trouves dans le texte"""
+        transitions = self.transitions
+        echecs = self.echecs
+        sorties = self.sorties
+        trouves: t.Set[int] = set()
+        etat = 0
+        for c in texte:
+            while etat and c not in transitions[etat]:
+                etat = echecs[etat]
+            etat = transitions[etat].get(c, 0)
+            if sorties[etat]:
+                trouves.update(sorties[etat])
+        return trouves
+
+
+class TiersRules:
+    """regles tiers_update compilees une seule fois.
+    les motifs purement litteraux sont resolus par l'automate,
+    les autres regexp ne sont essayees que si leur litteral obligatoire est present"""
+
+    def __init__(self, regles: t.Optional[t.Sequence[t.Sequence[str]]]) -> None:
+        self.remplacements: t.List[str] = []
+        self.regexps: t.Dict[int, t.Pattern[str]] = {}
+        # regexp sans litteral exploitable: toujours candidates
+        self.toujours: t.List[int] = []
+        motifs: t.List[t.Tuple[str, int]] = []
+        for index, regle in enumerate(regles or ()):
+            motif, remplacement = regle[0], regle[1]
+            self.remplacements.append(remplacement)
+            if est_litteral(motif):
+                motifs.append((motif.lower(), index))
+                continue
+            self.regexps[index] = re.compile(motif, FLAGS)
+            cle = prefiltre(motif)
+            if cle is None:
+                self.toujours.append(index)
+            else:
+                motifs.append((cle, index))
+        self.automate = AhoCorasick(motifs)
+
+    def __len__(self) -> int:
+        return len(self.remplacements)
+
+    def premiere(self, tiers: str, debut: int = 0) -> t.Optional[int]:
+        """renvoie l'indice de la premiere regle a partir de debut qui correspond a tiers"""
+        candidats = self.automate.chercher(plier(tiers))
+        candidats.update(self.toujours)
+        for index in sorted(candidats):
+            if index < debut:
+                continue
+            regexp = self.regexps.get(index)
+            if regexp is None or regexp.search(tiers):
+                return index
+        return None
+
+    def appliquer(self, tiers: str) -> str:
+        """applique les regles dans l'ordre comme la boucle historique:
+        chaque regle qui correspond remplace le tiers et les suivantes sont testees sur le remplacement"""
+        index = self.premiere(tiers)
+        while index is not None:
+            tiers = self.remplacements[index]
+            index = self.premiere(tiers, index + 1)
+        return tiers
+
+
+class CatRules:
+    """regles tiers_cat compilees en une seule regexp combinee: la premiere regle qui correspond gagne.
+    le resultat est memorise par tiers dans un cache lru borne"""
+
+    def __init__(self, regles: t.Optional[t.Sequence[t.Sequence[str]]], defaut: str, taille_memo: int = 4096) -> None:
+        self.defaut = defaut
+        self.taille_memo = taille_memo
+        self.memo: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.categories: t.List[str] = []
+        # chaque bloc est une regexp et, pour un bloc combine, la correspondance nom de groupe => indice de regle
+        self.blocs: t.List[t.Tuple[t.Pattern[str], t.Union[int, t.Dict[str, int]]]] = []
+        combinables: t.List[t.Tuple[int, str]] = []
+        for index, regle in enumerate(regles or ()):
+            motif = regle[0]
+            self.categories.append(regle[1])
+            if _combinable(motif):
+                combinables.append((index, motif))
+                continue
+            # un motif avec des groupes (references arrieres possibles) reste seul, a sa place
+            self._ajouter_bloc(combinables)
+            combinables = []
+            self.blocs.append((re.compile(motif, FLAGS), index))
+        self._ajouter_bloc(combinables)
+
+    def _ajouter_bloc(self, combinables: t.List[t.Tuple[int, str]]) -> None:
+        if not combinables:
+            return
+        # chaque alternative est un lookahead ancre au debut: l'ordre des regles prime sur la position dans le texte
+        alternatives = "|".join(f"(?P<r{index}>(?=(?s:.)*?(?:{motif})))" for index, motif in combinables)
+        try:
+            regexp = re.compile(rf"\A(?:{alternatives})", FLAGS)
+        except re.error:
+            for index, motif in combinables:
+                self.blocs.append((re.compile(motif, FLAGS), index))
+            return
+        self.blocs.append((regexp, {f"r{index}": index for index, _ in combinables}))
+
+    def _chercher(self, tiers: str) -> str:
+        for regexp, groupes in self.blocs:
+            if isinstance(groupes, int):
+                if regexp.search(tiers):
+                    return self.categories[groupes]
+                continue
+            trouve = regexp.match(tiers)
+            if trouve:
+                return self.categories[groupes[t.cast(str, trouve.lastgroup)]]
+        return self.defaut
+
+    def resoudre(self, tiers: str) -> str:
+        """renvoie la categorie du tiers, ou la categorie par defaut"""
+        try:
+            categorie = self.memo[tiers]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.memo.move_to_end(tiers)
+            return categorie
+        categorie = self._chercher(tiers)
+        self.memo[tiers] = categorie
+        if len(self.memo) > self.taille_memo:
+            self.memo.popitem(last=False)
+        return categorie
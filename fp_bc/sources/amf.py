@@ -1,19 +1,38 @@
 # -*- coding: utf-8 -*-
 """ source pour les sicav amf """
 
+import concurrent.futures
 import datetime
-import time
+import decimal
 import logging
+import os
 import pytz
-from dateutil.parser import parse as parse_datetime
 from beancount.prices import source as bean_source
 from beancount.core.number import D
 import bs4
 import typing
 import datetime
 
-import requests
 from fp_bc import utils
+from fp_bc.sources import batch
+from fp_bc.sources import price_cache
+from fp_bc.sources import session
+
+URL_GECO = "https://geco.amf-france.org"
+
+try:
+    import lxml  # noqa: F401 pylint: disable=W0611
+
+    PARSEUR = "lxml"
+except ImportError:
+    PARSEUR = "html.parser"
+
+# seuls les noeuds utiles des pages geco sont construits
+_FILTRE_COTATION = bs4.SoupStrainer(["label", "td"])
+_FILTRE_IDENTIFIANTS = bs4.SoupStrainer("input", attrs={"name": ["NumProd", "NumPart"]})
+_FILTRE_VL = bs4.SoupStrainer("tr", class_=["ligne1", "ligne2"])
+# un pool d'analyse n'est lance que pour les lots d'au moins SEUIL_POOL isin
+SEUIL_POOL = 8
 
 
 class AmfException(utils.UtilsException):
@@ -22,12 +41,79 @@ class AmfException(utils.UtilsException):
     pass
 
 
+def analyser_cotation(contenu: bytes) -> typing.Optional[typing.Tuple[str, str]]:
+    """date et valeur liquidative (textes) d'une page de recherche, None si l'isin n'est pas dans la base
+    @raise AmfException si la page n'a pas la forme attendue"""
+    soup = bs4.BeautifulSoup(contenu, PARSEUR, parse_only=_FILTRE_COTATION)
+    nbrep = soup.find("label", {"id": "Nbrep"})
+    if nbrep and nbrep.find("caption") and nbrep.find("caption").string == "Votre recherche a abouti à 0 réponse(s).":
+        return None
+    values = soup.find_all(class_="ResultatCritereValue")
+    keys = soup.find_all(class_="ResultatCritere")
+    result = dict(zip([v.get_text() for v in keys], [v.get_text() for v in values]))
+    try:
+        return result["Date VL :"], soup.find("td", string="Valeur (€) :").next_sibling.get_text(strip=True)
+    except Exception:
+        raise AmfException("page de resultat inattendue")
+
+
+def analyser_identifiants(contenu: bytes) -> typing.Optional[str]:
+    """NumProd:NumPart d'une page de recherche, None si absents"""
+    soup = bs4.BeautifulSoup(contenu, PARSEUR, parse_only=_FILTRE_IDENTIFIANTS)
+    try:
+        numProd = soup.find("input", {"name": "NumProd"})["value"]
+        numPart = soup.find("input", {"name": "NumPart"})["value"]
+    except Exception:
+        return None
+    return f"{numProd}:{numPart}"
+
+
+def analyser_vl(contenu: bytes) -> typing.List[typing.Tuple[datetime.date, decimal.Decimal]]:
+    """toutes les lignes (date, valeur liquidative) d'une page d'historique"""
+    soup = bs4.BeautifulSoup(contenu, PARSEUR, parse_only=_FILTRE_VL)
+    valeurs = []
+    for ligne in soup.find_all("tr"):
+        cellules = ligne.find_all("td")
+        try:
+            theDate = utils.strpdate(cellules[0].get_text(strip=True), fmt="%d/%m/%Y")
+            thePrice = D(cellules[1].get_text(strip=True).replace(" ", "").replace(",", "."))
+        except Exception:
+            continue
+        valeurs.append((theDate, thePrice))
+    return valeurs
+
+
+A = typing.TypeVar("A")
+
+
 class Source(bean_source.Source):
+    # pool de processus d'analyse, actif seulement pendant un lot: les threads reseau n'attendent que leur page
+    _pool: typing.Optional[concurrent.futures.Executor] = None
+
+    def _analyser(self, fonction: typing.Callable[[bytes], A], contenu: bytes) -> A:
+        if self._pool is None:
+            return fonction(contenu)
+        return self._pool.submit(fonction, contenu).result()
+
     def get_latest_price(self, ticker: str) -> typing.Optional[bean_source.SourcePrice]:
+        return price_cache.get_cache().cached("amf", ticker, price_cache.TTL_AMF, lambda: self._get_latest_price(ticker))
+
+    def get_latest_prices(self, tickers: typing.Sequence[str]) -> typing.List[typing.Optional[bean_source.SourcePrice]]:
+        """derniers prix de plusieurs isin en parallele, dans l'ordre des tickers.
+        sur une machine multi-coeurs, les pages sont analysees dans un pool de processus"""
+        if len(set(tickers)) < SEUIL_POOL or (os.cpu_count() or 1) < 2:
+            return batch.get_latest_prices(self.get_latest_price, tickers, batch.hote(URL_GECO))
+        with concurrent.futures.ProcessPoolExecutor() as pool:
+            self._pool = pool
+            try:
+                return batch.get_latest_prices(self.get_latest_price, tickers, batch.hote(URL_GECO))
+            finally:
+                self._pool = None
+
+    def _get_latest_price(self, ticker: str) -> typing.Optional[bean_source.SourcePrice]:
         try:
             log = logging.getLogger()
             log.info(f"AMF:{ticker}")
-            time.sleep(5)
             payload = {
                 "varvalidform": "on",
                 "NomProd": "",
@@ -41,27 +127,21 @@ class Source(bean_source.Source):
                 "valid_form": "Lancer+la+recherche",
                 "sltix": "1+2+3+INVESTMENT+MANAGERS",
             }
-            req = requests.get("https://geco.amf-france.org/Bio/rech_part.aspx", params=payload)
-            soup = bs4.BeautifulSoup(req.content, "html.parser")
-            if (
-                soup.find("label", {"id": "Nbrep"})
-                and soup.find("label", {"id": "Nbrep"}).find("caption").string == "Votre recherche a abouti à 0 réponse(s)."
-            ):
+            req = session.get(f"{URL_GECO}/Bio/rech_part.aspx", params=payload)
+            try:
+                cotation = self._analyser(analyser_cotation, req.content)
+            except AmfException:
+                raise AmfException("erreur pour le ticker %s" % ticker)
+            if cotation is None:
                 raise AmfException("pas de correspondance pour le ticker %s dans la base de l'AMF" % ticker)
-            else:
-                values = soup.find_all(class_="ResultatCritereValue")
-                keys = soup.find_all(class_="ResultatCritere")
-                result = dict(zip([v.get_text() for v in keys], [v.get_text() for v in values]))
-                try:
-                    date_req = utils.strpdate(result["Date VL :"], fmt="%d/%m/%Y")
-                    timezone = pytz.timezone('Europe/Paris')
-                    dt = timezone.localize(datetime.datetime(date_req.year, date_req.month, date_req.day, 17, 30))
-
-                    thePrice = soup.find("td", text="Valeur (€) :").next_sibling.get_text(strip=True)
-                    montant_req = D(thePrice.replace(" ", "").replace(",", ".")).quantize(D("0.01"))
-                    return bean_source.SourcePrice(montant_req, dt, "EUR")
-                except Exception:
-                    raise AmfException("erreur pour le ticker %s" % ticker)
+            try:
+                date_req = utils.strpdate(cotation[0], fmt="%d/%m/%Y")
+                timezone = pytz.timezone('Europe/Paris')
+                dt = timezone.localize(datetime.datetime(date_req.year, date_req.month, date_req.day, 17, 30))
+                montant_req = D(cotation[1].replace(" ", "").replace(",", ".")).quantize(D("0.01"))
+                return bean_source.SourcePrice(montant_req, dt, "EUR")
+            except Exception:
+                raise AmfException("erreur pour le ticker %s" % ticker)
         except AmfException as e:
             log.error(str(e))
             return None
@@ -87,44 +167,51 @@ class Source(bean_source.Source):
           time must be timezone-aware.
         """
         log = logging.getLogger()
-        log.info(f"AMF:{ticker}")
-        s = requests.Session()
+        log.info(f"AMF:{ticker} {time.date()}")
+        identifiants = self._identifiants(ticker)
+        if identifiants is None:
+            log.error("ISIN introuvable sur AMFGeco")
+            return None
+        numProd, numPart = identifiants
+        trouve = price_cache.get_cache().historique(
+            "amf", ticker, time.date(), lambda debut, fin: self._valeurs_liquidatives(numProd, numPart, debut, fin)
+        )
+        if trouve is None:
+            log.error("Pas de valeur liquidative publiée à cette date sur AMFGeco")
+            return None
+        jour, thePrice = trouve
+        theDate = pytz.timezone("Europe/Paris").localize(datetime.datetime(jour.year, jour.month, jour.day))
+        return bean_source.SourcePrice(thePrice.quantize(D("0.01")), theDate, "EUR")
+
+    def _identifiants(self, ticker: str) -> typing.Optional[typing.Tuple[str, str]]:
+        """NumProd et NumPart de l'isin, gardes dans le cache des prix: une seule recherche par isin"""
+        valeur = price_cache.get_cache().identifiant("amf", ticker, lambda: self._chercher_identifiants(ticker))
+        if valeur is None:
+            return None
+        numProd, numPart = valeur.split(":")
+        return numProd, numPart
+
+    def _chercher_identifiants(self, ticker: str) -> typing.Optional[str]:
         url = (
-            "https://geco.amf-france.org"
+            URL_GECO
             + "/Bio/rech_part.aspx?varvalidform=on&CodeISIN="
             + ticker
             + "&CLASSPROD=0&NumAgr=&selectNRJ=0&NomProd=&NomSOc=&action=new&valid_form=Lancer+la+recherche"
         )
+        r = session.get(url)
+        return self._analyser(analyser_identifiants, r.content)
 
-        r = s.get(url)
-        soup = bs4.BeautifulSoup(r.text, "html.parser")
-        try:
-            numProd = soup.find("input", {"name": "NumProd"})["value"]
-            numPart = soup.find("input", {"name": "NumPart"})["value"]
-        except Exception:
-            log.error("ISIN introuvable sur AMFGeco")
-            return None
-
+    def _valeurs_liquidatives(
+        self, numProd: str, numPart: str, debut: datetime.date, fin: datetime.date
+    ) -> typing.List[typing.Tuple[datetime.date, decimal.Decimal]]:
+        """toutes les valeurs liquidatives publiees entre debut et fin, en une seule requete"""
         url = (
-            "https://geco.amf-france.org"
-            + "Bio/info_part.aspx?SEC=VL&NumProd=" + numProd
+            URL_GECO
+            + "/Bio/info_part.aspx?SEC=VL&NumProd=" + numProd
             + "&NumPart=" + numPart
-            + "&DateDeb=" + str(time.date().day) + "%2F" + str(time.date().month) + "%2F" + str(time.date().year)
-            + "&DateFin=" + str(time.date().day) + "%2F" + str(time.date().month) + "%2F" + str(time.date().year)
+            + "&DateDeb=" + str(debut.day) + "%2F" + str(debut.month) + "%2F" + str(debut.year)
+            + "&DateFin=" + str(fin.day) + "%2F" + str(fin.month) + "%2F" + str(fin.year)
             + "&btnvalid=OK"
         )
-
-        r = s.get(url)
-        soup = bs4.BeautifulSoup(r.text, "html.parser")
-        try:
-            theDate = soup.find("tr", class_="ligne2").find_all("td")[0].get_text(strip=True)
-            theDate = parse_datetime(theDate, dayfirst=True)
-            fr_timezone = pytz.timezone("Europe/Paris")
-            theDate = theDate.astimezone(fr_timezone)
-
-            thePrice = soup.find("tr", class_="ligne2").find_all("td")[1].get_text(strip=True)
-            thePrice = D(thePrice.replace(" ", "").replace(",", ".")).quantize(D("0.01"))
-            return bean_source.SourcePrice(thePrice, theDate, "EUR")
-        except Exception:
-            log.error("Pas de valeur liquidative publiée à cette date sur AMFGeco")
-            return None
+        r = session.get(url)
+        return self._analyser(analyser_vl, r.content)
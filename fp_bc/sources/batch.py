@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""recuperation en parallele des prix: limite de debit et de connexions simultanees par hote"""
+
+import collections
+import concurrent.futures
+import contextlib
+import logging
+import threading
+import time
+import typing
+import urllib.parse
+
+from beancount.prices import source as bean_source
+
+from fp_bc.sources import session
+
+Limite = collections.namedtuple("Limite", "debit rafale simultanes")
+
+# debit en requetes par seconde, rafale = nombre de requetes autorisees d'un coup, simultanes = connexions en parallele
+LIMITES = {
+    "geco.amf-france.org": Limite(2.0, 4, 4),
+    "eodhistoricaldata.com": Limite(5.0, 5, 5),
+    "query1.finance.yahoo.com": Limite(10.0, 10, 8),
+}
+LIMITE_DEFAUT = Limite(5.0, 5, 4)
+
+
+class TokenBucket:
+    """seau a jetons: rafale jetons au depart, puis debit jetons par seconde.
+    un jeton est reserve a l'appel, l'attente se fait hors du verrou et les appelants sont servis dans l'ordre"""
+
+    def __init__(self, debit: float, rafale: int) -> None:
+        self.debit = debit
+        self.rafale = rafale
+        self.jetons = float(rafale)
+        self.dernier = time.monotonic()
+        self.verrou = threading.Lock()
+
+    def prendre(self) -> float:
+        """attend qu'un jeton soit disponible
+        @return le temps attendu en secondes"""
+        with self.verrou:
+            maintenant = time.monotonic()
+            self.jetons = min(float(self.rafale), self.jetons + (maintenant - self.dernier) * self.debit)
+            self.dernier = maintenant
+            self.jetons -= 1
+            attente = -self.jetons / self.debit if self.jetons < 0 else 0.0
+        if attente:
+            time.sleep(attente)
+        return attente
+
+
+class Hote:
+    """limite de debit et nombre maximum de requetes simultanees vers un hote"""
+
+    def __init__(self, nom: str, limite: Limite) -> None:
+        self.nom = nom
+        self.limite = limite
+        self.seau = TokenBucket(limite.debit, limite.rafale)
+        self.semaphore = threading.BoundedSemaphore(limite.simultanes)
+        self.log = logging.getLogger("batch")
+
+    @contextlib.contextmanager
+    def requete(self) -> typing.Iterator[None]:
+        """a utiliser autour de chaque requete http vers l'hote"""
+        with self.semaphore:
+            attente = self.seau.prendre()
+            if attente:
+                self.log.debug(f"{self.nom}: attente {attente:.2f}s (limite de debit)")
+            yield
+
+
+_hotes: typing.Dict[str, Hote] = {}
+_verrou_hotes = threading.Lock()
+
+
+def hote(url: str) -> Hote:
+    """limiteur partage par toutes les requetes du processus vers l'hote de l'url"""
+    nom = urllib.parse.urlsplit(url).netloc or url
+    with _verrou_hotes:
+        resultat = _hotes.get(nom)
+        if resultat is None:
+            resultat = _hotes[nom] = Hote(nom, LIMITES.get(nom, LIMITE_DEFAUT))
+        return resultat
+
+
+def configurer(url: str, limite: Limite) -> None:
+    """change la limite d'un hote (ex: serveur local pour les essais)"""
+    nom = urllib.parse.urlsplit(url).netloc or url
+    with _verrou_hotes:
+        _hotes[nom] = Hote(nom, limite)
+
+
+R = typing.TypeVar("R")
+
+
+def en_parallele(
+    fonction: typing.Callable[[str], typing.Optional[R]],
+    tickers: typing.Sequence[str],
+    limiteur: Hote,
+    workers: typing.Optional[int] = None,
+) -> typing.List[typing.Optional[R]]:
+    """appelle fonction pour chaque ticker distinct dans un pool de threads.
+    @param fonction: methode de la source, dont les requetes passent par session.get (donc par limiteur)
+    @param workers: nombre de threads, par defaut le nombre de requetes simultanees autorisees par l'hote
+    @return les resultats dans l'ordre des tickers, None pour un ticker en erreur"""
+    log = logging.getLogger("batch")
+    uniques = list(dict.fromkeys(tickers))
+
+    def appel(ticker: str) -> typing.Optional[R]:
+        try:
+            return fonction(ticker)
+        except Exception:  # pylint: disable=W0703
+            # une erreur reseau sur un ticker ne doit pas faire perdre les autres
+            log.exception(f"{limiteur.nom}:{ticker}")
+            return None
+
+    nb_workers = min(workers or limiteur.limite.simultanes, len(uniques))
+    if nb_workers <= 1:
+        resultats = [appel(ticker) for ticker in uniques]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nb_workers, thread_name_prefix="prix") as pool:
+            resultats = list(pool.map(appel, uniques))
+    log.info(session.stats())
+    par_ticker = dict(zip(uniques, resultats))
+    return [par_ticker[ticker] for ticker in tickers]
+
+
+def get_latest_prices(
+    fonction: typing.Callable[[str], typing.Optional[bean_source.SourcePrice]],
+    tickers: typing.Sequence[str],
+    limiteur: Hote,
+    workers: typing.Optional[int] = None,
+) -> typing.List[typing.Optional[bean_source.SourcePrice]]:
+    """derniers prix des tickers en parallele (voir en_parallele)
+    @param fonction: get_latest_price de la source"""
+    return en_parallele(fonction, tickers, limiteur, workers)
@@ -1,4 +1,5 @@
 import datetime
+import decimal
 import os
 from dotenv import load_dotenv
 from beancount.prices import source as bean_source
@@ -7,42 +8,106 @@ from beancount.core.number import D
 from beancount.core import data
 from beancount.core.amount import Amount
 import logging
+import typing
 from fp_bc import utils
+from fp_bc.sources import batch
+from fp_bc.sources import price_cache
+from fp_bc.sources import session
 import pytz
 
+URL_EOD = "https://eodhistoricaldata.com/api"
+FICHIER_ENV = "D:/ledger/.env"
+# fenetres successives (en jours) demandees pour le dernier cours
+FENETRES = (10, 45, 400)
+
+_env_charge = False
+
 
 class eodError(ValueError):
     "An error from the eod API."
 
 
+def _apikey() -> str:
+    """cle d'api, le fichier .env n'est lu qu'une fois par processus"""
+    global _env_charge
+    if not _env_charge:
+        load_dotenv(FICHIER_ENV)
+        _env_charge = True
+    apikey = os.getenv("APIKEY_eob")
+    if not apikey:
+        raise eodError("pas de config apikey")
+    return apikey
+
+
+def _cours(isin: str, apikey: str, debut: datetime.date, fin: datetime.date) -> typing.List[typing.Dict[str, typing.Any]]:
+    """cours de cloture de l'isin entre debut et fin inclus, du plus recent au plus ancien"""
+    log = logging.getLogger()
+    url = f"{URL_EOD}/eod/{isin}.EUFUND"
+    params = {"api_token": apikey, "fmt": "json", "order": "d", "from": debut.isoformat(), "to": fin.isoformat()}
+    r = session.get(url, params)
+    if r.status_code == requests.codes.ok:
+        log.debug(f"req {isin} ok")
+    else:
+        raise eodError(r.status_code, r.reason, url)
+    return r.json(parse_float=D)
+
+
+def _lignes(isin: str, apikey: str, debut: datetime.date, fin: datetime.date) -> typing.List[typing.Tuple[datetime.date, decimal.Decimal]]:
+    return [(utils.strpdate(ligne["date"]), D(ligne["close"])) for ligne in _cours(isin, apikey, debut, fin)]
+
+
+def _heure(jour: datetime.date) -> datetime.datetime:
+    """heure de publication d'un cours de cloture"""
+    return pytz.timezone('Europe/Paris').localize(datetime.datetime(jour.year, jour.month, jour.day, 17, 30))
+
+
 class Source(bean_source.Source):
     def get_latest_price(self, ticker: str) -> bean_source.SourcePrice:
+        return price_cache.get_cache().cached("eod", ticker, price_cache.TTL_EOD, lambda: self._get_latest_price(ticker))
+
+    def get_latest_prices(self, tickers: typing.Sequence[str]) -> typing.List[typing.Optional[bean_source.SourcePrice]]:
+        """derniers prix de plusieurs isin en parallele, dans l'ordre des tickers.
+        la cle d'api et les connexions a l'hote sont partagees par toutes les requetes"""
+        return batch.get_latest_prices(self.get_latest_price, tickers, batch.hote(URL_EOD))
+
+    def _get_latest_price(self, ticker: str) -> bean_source.SourcePrice:
         log = logging.getLogger()
         log.info(f"eod:{ticker}")
         try:
-            load_dotenv("D:/ledger/.env")
-            if os.getenv("APIKEY_eob"):
-                apikey = os.getenv("APIKEY_eob")
-            else:
-                raise eodError("pas de config apikey")
+            apikey = _apikey()
             isin = ticker
-            baseurl = "https://eodhistoricaldata.com/api/eod"
-            params = {"api_token": apikey, "fmt": "json", 'order': "d"}
-            url = f"{baseurl}/{isin}.EUFUND"
-            r = requests.get(url, params)
-            if r.status_code == requests.codes.ok:
-                log.debug(f"req {isin} ok")
+            fin = datetime.date.today()
+            # seuls les derniers jours sont demandes; la fenetre n'est elargie que si le fonds n'a rien publie
+            for jours in FENETRES:
+                content = _cours(isin, apikey, fin - datetime.timedelta(days=jours), fin)
+                if content:
+                    break
             else:
-                raise eodError(r.status_code, r.reason, url)
-            content = r.json(parse_float=D)
+                raise eodError(f"pas de cours pour {isin} depuis {FENETRES[-1]} jours")
             new = content[0]
             price = D(new['close']).quantize(D("0.01"))
-            date_naive = utils.strpdate(new['date'])
-            timezone = pytz.timezone('Europe/Paris')
-            trade_time = timezone.localize(datetime.datetime(date_naive.year, date_naive.month, date_naive.day, 17, 30))
+            trade_time = _heure(utils.strpdate(new['date']))
             currency = "EUR"
             log.debug(f"price: {price} \t day:{trade_time} \t cur:{currency}")
             return bean_source.SourcePrice(price, trade_time, currency)
         except eodError as e:
             log.error(str(e))
             return None
+
+    def get_historical_price(self, ticker: str, time: datetime.datetime) -> typing.Optional[bean_source.SourcePrice]:
+        """cours de cloture au jour demande, ou au dernier jour de cotation precedent (week-end, ferie).
+        l'historique de l'isin est garde dans le cache des prix: seules les periodes jamais demandees sont telechargees"""
+        log = logging.getLogger()
+        log.info(f"eod:{ticker} {time.date()}")
+        try:
+            apikey = _apikey()
+            trouve = price_cache.get_cache().historique(
+                "eod", ticker, time.date(), lambda debut, fin: _lignes(ticker, apikey, debut, fin)
+            )
+            if trouve is None:
+                raise eodError(f"pas de cours pour {ticker} au {time.date()}")
+        except eodError as e:
+            log.error(str(e))
+            return None
+        jour, price = trouve
+        return bean_source.SourcePrice(price.quantize(D("0.01")), _heure(jour), "EUR")
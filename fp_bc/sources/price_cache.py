@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""cache disque (sqlite) des prix renvoyes par les sources amf, eod et yahoo"""
+
+import bisect
+import datetime
+import decimal
+import logging
+import os
+import sqlite3
+import threading
+import time
+import typing
+
+from beancount.core.number import D
+from beancount.prices import source as bean_source
+
+# duree de validite d'un dernier prix, en secondes, selon le rythme de publication de chaque source
+TTL_AMF = 12 * 3600  # valeur liquidative publiee au plus une fois par jour
+TTL_EOD = 6 * 3600  # cours de cloture
+TTL_YAHOO = 15 * 60  # cours intraday
+# un prix historique ne change plus
+TTL_HISTORIQUE = None
+
+DERNIER = "latest"
+_ABSENT = object()
+# historique: un jour sans cours (week-end, ferie) renvoie le cours precedent s'il date de moins de MARGE jours
+MARGE = datetime.timedelta(days=7)
+# historique: a chaque requete on demande aussi les ETENDUE jours autour de la date pour servir les dates voisines
+ETENDUE = datetime.timedelta(days=366)
+# les jours recents ne sont consideres comme couverts que jusqu'au dernier cours recu (publication en retard)
+RECENT = datetime.timedelta(days=7)
+UN_JOUR = datetime.timedelta(days=1)
+
+
+class Serie:
+    """historique d'un ticker: dates triees, cours, et intervalles de dates deja demandes a la source"""
+
+    __slots__ = ("dates", "nombres", "intervalles")
+
+    def __init__(self) -> None:
+        self.dates: typing.List[datetime.date] = []
+        self.nombres: typing.List[decimal.Decimal] = []
+        self.intervalles: typing.List[typing.Tuple[datetime.date, datetime.date]] = []
+
+    def ajouter(self, jour: datetime.date, nombre: decimal.Decimal) -> None:
+        i = bisect.bisect_left(self.dates, jour)
+        if i < len(self.dates) and self.dates[i] == jour:
+            self.nombres[i] = nombre
+        else:
+            self.dates.insert(i, jour)
+            self.nombres.insert(i, nombre)
+
+    def couvrir(self, debut: datetime.date, fin: datetime.date) -> None:
+        """ajoute l'intervalle [debut, fin] aux intervalles couverts en fusionnant les intervalles contigus"""
+        if fin < debut:
+            return
+        resultat = []
+        for deb, fi in self.intervalles:
+            if fi + UN_JOUR < debut or fin + UN_JOUR < deb:
+                resultat.append((deb, fi))
+            else:
+                debut, fin = min(debut, deb), max(fin, fi)
+        resultat.append((debut, fin))
+        self.intervalles = sorted(resultat)
+
+    def manquants(self, debut: datetime.date, fin: datetime.date) -> typing.List[typing.Tuple[datetime.date, datetime.date]]:
+        """parties de [debut, fin] qui n'ont pas encore ete demandees"""
+        resultat = []
+        for deb, fi in self.intervalles:
+            if fi < debut:
+                continue
+            if deb > fin:
+                break
+            if deb > debut:
+                resultat.append((debut, deb - UN_JOUR))
+            debut = fi + UN_JOUR
+        if debut <= fin:
+            resultat.append((debut, fin))
+        return resultat
+
+    def periode(self, debut: datetime.date, fin: datetime.date) -> typing.List[typing.Tuple[datetime.date, decimal.Decimal]]:
+        i = bisect.bisect_left(self.dates, debut)
+        j = bisect.bisect_right(self.dates, fin)
+        return list(zip(self.dates[i:j], self.nombres[i:j]))
+
+    def cours(self, jour: datetime.date) -> typing.Optional[typing.Tuple[datetime.date, decimal.Decimal]]:
+        """cours du jour, ou du dernier jour de cotation precedent dans la limite de MARGE"""
+        i = bisect.bisect_right(self.dates, jour) - 1
+        if i < 0 or jour - self.dates[i] > MARGE:
+            return None
+        return self.dates[i], self.nombres[i]
+
+
+def chemin_defaut() -> str:
+    """fichier du cache: variable d'environnement FP_BC_PRICE_CACHE, sinon ~/.cache/fp_bc/prices.sqlite"""
+    chemin = os.getenv("FP_BC_PRICE_CACHE")
+    if chemin:
+        return chemin
+    return os.path.join(os.path.expanduser("~"), ".cache", "fp_bc", "prices.sqlite")
+
+
+class PriceCache:
+    """prix par (source, ticker, date) avec une duree de validite par source.
+    les appels d'un meme run sont memorises en memoire, y compris les echecs,
+    et la taille de la base est bornee en supprimant les prix les moins recemment utilises"""
+
+    def __init__(self, chemin: typing.Optional[str] = None, taille_max: int = 20000) -> None:
+        self.chemin = chemin if chemin is not None else chemin_defaut()
+        self.taille_max = taille_max
+        self.log = logging.getLogger("price_cache")
+        self.memo: typing.Dict[typing.Tuple[str, str, str], typing.Optional[bean_source.SourcePrice]] = {}
+        self.verrou = threading.RLock()
+        if self.chemin != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.chemin)), exist_ok=True)
+        self.connexion = sqlite3.connect(self.chemin, check_same_thread=False)
+        with self.connexion:
+            self.connexion.execute(
+                "CREATE TABLE IF NOT EXISTS prix ("
+                "source TEXT, ticker TEXT, jour TEXT, nombre TEXT, heure TEXT, devise TEXT, "
+                "lu REAL, utilise REAL, PRIMARY KEY (source, ticker, jour))"
+            )
+            self.connexion.execute(
+                "CREATE TABLE IF NOT EXISTS historique (source TEXT, ticker TEXT, jour TEXT, nombre TEXT, PRIMARY KEY (source, ticker, jour))"
+            )
+            self.connexion.execute("CREATE TABLE IF NOT EXISTS couverture (source TEXT, ticker TEXT, debut TEXT, fin TEXT)")
+            self.connexion.execute(
+                "CREATE TABLE IF NOT EXISTS identifiant (source TEXT, ticker TEXT, valeur TEXT, PRIMARY KEY (source, ticker))"
+            )
+        self.series: typing.Dict[typing.Tuple[str, str], Serie] = {}
+
+    @staticmethod
+    def _jour(date: typing.Optional[datetime.date]) -> str:
+        return DERNIER if date is None else date.isoformat()
+
+    def get(
+        self, source: str, ticker: str, ttl: typing.Optional[float], date: typing.Optional[datetime.date] = None
+    ) -> typing.Optional[bean_source.SourcePrice]:
+        """renvoie le prix en cache encore valide, sinon None"""
+        jour = self._jour(date)
+        with self.verrou:
+            ligne = self.connexion.execute(
+                "SELECT nombre, heure, devise, lu FROM prix WHERE source = ? AND ticker = ? AND jour = ?", (source, ticker, jour)
+            ).fetchone()
+            if ligne is None:
+                return None
+            nombre, heure, devise, lu = ligne
+            maintenant = time.time()
+            if ttl is not None and maintenant - lu > ttl:
+                return None
+            with self.connexion:
+                self.connexion.execute(
+                    "UPDATE prix SET utilise = ? WHERE source = ? AND ticker = ? AND jour = ?", (maintenant, source, ticker, jour)
+                )
+        return bean_source.SourcePrice(D(nombre), datetime.datetime.fromisoformat(heure), devise)
+
+    def put(self, source: str, ticker: str, prix: bean_source.SourcePrice, date: typing.Optional[datetime.date] = None) -> None:
+        maintenant = time.time()
+        with self.verrou, self.connexion:
+            self.connexion.execute(
+                "INSERT OR REPLACE INTO prix VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, ticker, self._jour(date), str(prix.price), prix.time.isoformat(), prix.quote_currency, maintenant, maintenant),
+            )
+            nombre = self.connexion.execute("SELECT COUNT(*) FROM prix").fetchone()[0]
+            if nombre > self.taille_max:
+                self.connexion.execute(
+                    "DELETE FROM prix WHERE rowid IN (SELECT rowid FROM prix ORDER BY utilise LIMIT ?)", (nombre - self.taille_max,)
+                )
+
+    def cached(
+        self,
+        source: str,
+        ticker: str,
+        ttl: typing.Optional[float],
+        fetch: typing.Callable[[], typing.Optional[bean_source.SourcePrice]],
+        date: typing.Optional[datetime.date] = None,
+    ) -> typing.Optional[bean_source.SourcePrice]:
+        """renvoie le prix memorise pour ce run, sinon celui du cache disque, sinon appelle fetch et stocke le resultat"""
+        cle = (source, ticker, self._jour(date))
+        prix = self.memo.get(cle, _ABSENT)
+        if prix is not _ABSENT:
+            self.log.debug(f"{source}:{ticker} deja demande dans ce run")
+            return typing.cast(typing.Optional[bean_source.SourcePrice], prix)
+        prix = self.get(source, ticker, ttl, date)
+        if prix is not None:
+            self.log.debug(f"{source}:{ticker} lu dans le cache")
+        else:
+            prix = fetch()
+            if prix is not None:
+                self.put(source, ticker, prix, date)
+        self.memo[cle] = prix
+        return prix
+
+    def cached_plusieurs(
+        self,
+        source: str,
+        tickers: typing.Iterable[str],
+        ttl: typing.Optional[float],
+        fetch: typing.Callable[[typing.List[str]], typing.Dict[str, typing.Optional[bean_source.SourcePrice]]],
+    ) -> typing.Dict[str, typing.Optional[bean_source.SourcePrice]]:
+        """comme cached pour les derniers prix de plusieurs tickers: fetch recoit en une fois tous les tickers
+        absents du memo et du cache disque
+        @return prix par ticker"""
+        resultats: typing.Dict[str, typing.Optional[bean_source.SourcePrice]] = {}
+        manquants = []
+        for ticker in dict.fromkeys(tickers):
+            prix = self.memo.get((source, ticker, DERNIER), _ABSENT)
+            if prix is _ABSENT:
+                prix = self.get(source, ticker, ttl)
+                if prix is None:
+                    manquants.append(ticker)
+                    continue
+                self.memo[(source, ticker, DERNIER)] = prix
+            resultats[ticker] = typing.cast(typing.Optional[bean_source.SourcePrice], prix)
+        if manquants:
+            self.log.debug(f"{source}: {len(resultats)} prix deja connus, {len(manquants)} demandes")
+            trouves = fetch(manquants)
+            for ticker in manquants:
+                prix = trouves.get(ticker)
+                if prix is not None:
+                    self.put(source, ticker, prix)
+                self.memo[(source, ticker, DERNIER)] = resultats[ticker] = prix
+        return resultats
+
+    def identifiant(self, source: str, ticker: str, fetch: typing.Callable[[], typing.Optional[str]]) -> typing.Optional[str]:
+        """identifiant interne de la source pour un ticker (ex: NumProd/NumPart amf pour un isin), sans expiration.
+        fetch n'est appele que si l'identifiant n'est pas connu; un echec n'est pas enregistre"""
+        with self.verrou:
+            ligne = self.connexion.execute(
+                "SELECT valeur FROM identifiant WHERE source = ? AND ticker = ?", (source, ticker)
+            ).fetchone()
+        if ligne is not None:
+            return typing.cast(str, ligne[0])
+        valeur = fetch()
+        if valeur is not None:
+            with self.verrou, self.connexion:
+                self.connexion.execute("INSERT OR REPLACE INTO identifiant VALUES (?, ?, ?)", (source, ticker, valeur))
+        return valeur
+
+    def serie(self, source: str, ticker: str) -> Serie:
+        """historique du ticker, lu une seule fois dans la base puis garde en memoire"""
+        with self.verrou:
+            serie = self.series.get((source, ticker))
+            if serie is None:
+                serie = self.series[(source, ticker)] = Serie()
+                for jour, nombre in self.connexion.execute(
+                    "SELECT jour, nombre FROM historique WHERE source = ? AND ticker = ? ORDER BY jour", (source, ticker)
+                ):
+                    serie.dates.append(datetime.date.fromisoformat(jour))
+                    serie.nombres.append(D(nombre))
+                for debut, fin in self.connexion.execute(
+                    "SELECT debut, fin FROM couverture WHERE source = ? AND ticker = ?", (source, ticker)
+                ):
+                    serie.couvrir(datetime.date.fromisoformat(debut), datetime.date.fromisoformat(fin))
+            return serie
+
+    def completer(
+        self,
+        source: str,
+        ticker: str,
+        debut: datetime.date,
+        fin: datetime.date,
+        lignes: typing.Iterable[typing.Tuple[datetime.date, decimal.Decimal]],
+    ) -> None:
+        """enregistre les cours recus pour l'intervalle demande [debut, fin]"""
+        lignes = list(lignes)
+        limite = datetime.date.today() - RECENT
+        if fin >= limite:
+            # un cours recent peut ne pas encore etre publie: l'intervalle sera redemande
+            fin = min(fin, max([limite - UN_JOUR] + [jour for jour, _ in lignes]))
+        with self.verrou, self.connexion:
+            serie = self.serie(source, ticker)
+            for jour, nombre in lignes:
+                serie.ajouter(jour, nombre)
+            serie.couvrir(debut, fin)
+            self.connexion.executemany(
+                "INSERT OR REPLACE INTO historique VALUES (?, ?, ?, ?)",
+                [(source, ticker, jour.isoformat(), str(nombre)) for jour, nombre in lignes],
+            )
+            self.connexion.execute("DELETE FROM couverture WHERE source = ? AND ticker = ?", (source, ticker))
+            self.connexion.executemany(
+                "INSERT INTO couverture VALUES (?, ?, ?, ?)",
+                [(source, ticker, deb.isoformat(), fi.isoformat()) for deb, fi in serie.intervalles],
+            )
+
+    def historique(
+        self,
+        source: str,
+        ticker: str,
+        jour: datetime.date,
+        fetch: typing.Callable[[datetime.date, datetime.date], typing.Iterable[typing.Tuple[datetime.date, decimal.Decimal]]],
+    ) -> typing.Optional[typing.Tuple[datetime.date, decimal.Decimal]]:
+        """cours du ticker au jour donne (ou au jour de cotation precedent) servi depuis l'historique local.
+        seules les parties manquantes autour du jour sont demandees a la source
+        @param fetch: fonction (debut, fin) => [(jour, cours)] qui interroge la source"""
+        serie = self.serie(source, ticker)
+        if serie.manquants(jour - MARGE, jour):
+            self._telecharger(source, ticker, serie, jour - ETENDUE, min(jour + ETENDUE, datetime.date.today()), fetch)
+        return serie.cours(jour)
+
+    def periode(
+        self,
+        source: str,
+        ticker: str,
+        debut: datetime.date,
+        fin: datetime.date,
+        fetch: typing.Callable[[datetime.date, datetime.date], typing.Iterable[typing.Tuple[datetime.date, decimal.Decimal]]],
+    ) -> typing.List[typing.Tuple[datetime.date, decimal.Decimal]]:
+        """tous les cours du ticker entre debut et fin inclus, en ne demandant a la source que les parties manquantes"""
+        serie = self.serie(source, ticker)
+        self._telecharger(source, ticker, serie, debut, min(fin, datetime.date.today()), fetch)
+        return serie.periode(debut, fin)
+
+    def _telecharger(
+        self,
+        source: str,
+        ticker: str,
+        serie: Serie,
+        debut: datetime.date,
+        fin: datetime.date,
+        fetch: typing.Callable[[datetime.date, datetime.date], typing.Iterable[typing.Tuple[datetime.date, decimal.Decimal]]],
+    ) -> None:
+        for deb, fi in serie.manquants(debut, fin):
+            self.log.debug(f"{source}:{ticker} historique demande du {deb} au {fi}")
+            self.completer(source, ticker, deb, fi, fetch(deb, fi))
+
+
+_cache: typing.Optional[PriceCache] = None
+_verrou_cache = threading.Lock()
+
+
+def get_cache() -> PriceCache:
+    """cache partage par toutes les sources du processus"""
+    global _cache
+    with _verrou_cache:
+        if _cache is None:
+            _cache = PriceCache()
+        return _cache
+
+
+def set_cache(cache: typing.Optional[PriceCache]) -> None:
+    """remplace le cache partage (ex: un cache ":memory:" pour les essais hors ligne)"""
+    global _cache
+    with _verrou_cache:
+        _cache = cache
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""sessions http partagees par hote: connexions keep-alive, timeouts, reessais avec backoff et echeance globale"""
+
+import logging
+import random
+import threading
+import time
+import typing
+import urllib.parse
+
+import requests
+import requests.adapters
+
+from fp_bc.sources import batch
+
+# (connexion, lecture) en secondes
+TIMEOUT = (3.05, 20.0)
+# duree maximum d'un appel, reessais compris
+ECHEANCE = 60.0
+ESSAIS = 4
+DELAI_INITIAL = 0.5
+DELAI_MAX = 8.0
+STATUTS_REESSAI = frozenset((429, 500, 502, 503, 504))
+
+
+class DelaiDepasse(requests.Timeout):
+    """l'echeance globale de l'appel est depassee"""
+
+
+class _Hote:
+    __slots__ = ("nom", "session", "adaptateur", "requetes", "reessais")
+
+    def __init__(self, nom: str) -> None:
+        self.nom = nom
+        self.session = requests.Session()
+        simultanes = batch.hote(nom).limite.simultanes
+        self.adaptateur = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=simultanes, max_retries=0)
+        self.session.mount("http://", self.adaptateur)
+        self.session.mount("https://", self.adaptateur)
+        self.requetes = 0
+        self.reessais = 0
+
+    def connexions(self) -> int:
+        """nombre de connexions tcp ouvertes depuis la creation de la session"""
+        pools = self.adaptateur.poolmanager.pools
+        return sum(pools[cle].num_connections for cle in pools.keys())
+
+
+_hotes: typing.Dict[str, _Hote] = {}
+_verrou = threading.Lock()
+
+
+def _hote(url: str) -> _Hote:
+    nom = urllib.parse.urlsplit(url).netloc
+    with _verrou:
+        resultat = _hotes.get(nom)
+        if resultat is None:
+            resultat = _hotes[nom] = _Hote(nom)
+        return resultat
+
+
+def session(url: str) -> requests.Session:
+    """session partagee par toutes les requetes du processus vers l'hote de l'url"""
+    return _hote(url).session
+
+
+def _attente(essai: int, reponse: typing.Optional[requests.Response]) -> float:
+    """backoff exponentiel avec jitter, ou la duree demandee par le serveur (Retry-After)"""
+    if reponse is not None:
+        retry_after = reponse.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), DELAI_MAX)
+    return random.uniform(0.5, 1.0) * min(DELAI_MAX, DELAI_INITIAL * 2 ** essai)
+
+
+def get(
+    url: str,
+    params: typing.Any = None,
+    headers: typing.Optional[typing.Dict[str, typing.Any]] = None,
+    timeout: typing.Tuple[float, float] = TIMEOUT,
+    essais: int = ESSAIS,
+    echeance: float = ECHEANCE,
+) -> requests.Response:
+    """GET via la session de l'hote, en respectant la limite de debit de l'hote (batch.hote).
+    les erreurs de connexion, les timeouts et les statuts 429/5xx sont reessayes au plus essais fois.
+    @return la derniere reponse, que l'appelant doit verifier (statut)
+    @raise DelaiDepasse si l'echeance est atteinte, sinon la derniere exception requests"""
+    log = logging.getLogger("session")
+    hote = _hote(url)
+    limiteur = batch.hote(url)
+    debut = time.monotonic()
+    essai = 0
+    while True:
+        restant = echeance - (time.monotonic() - debut)
+        if restant <= 0:
+            raise DelaiDepasse(f"{hote.nom}: echeance de {echeance}s depassee apres {essai} essai(s)")
+        reponse = None
+        erreur: typing.Optional[requests.RequestException] = None
+        connexions = hote.connexions()
+        try:
+            with limiteur.requete():
+                hote.requetes += 1
+                reponse = hote.session.get(
+                    url, params=params, headers=headers, timeout=(min(timeout[0], restant), min(timeout[1], restant))
+                )
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            erreur = exc
+        log.debug(f"{hote.nom}: connexion {'nouvelle' if hote.connexions() > connexions else 'reutilisee'}")
+        if erreur is None and reponse is not None and reponse.status_code not in STATUTS_REESSAI:
+            return reponse
+        essai += 1
+        if essai >= essais:
+            if erreur is not None:
+                raise erreur
+            return typing.cast(requests.Response, reponse)
+        attente = min(_attente(essai - 1, reponse), max(0.0, echeance - (time.monotonic() - debut)))
+        hote.reessais += 1
+        motif = repr(erreur) if erreur is not None else f"statut {typing.cast(requests.Response, reponse).status_code}"
+        log.info(f"{hote.nom}: {motif}, reessai {essai}/{essais - 1} dans {attente:.2f}s")
+        time.sleep(attente)
+
+
+def stats() -> str:
+    """requetes, connexions ouvertes et reessais par hote"""
+    with _verrou:
+        hotes = list(_hotes.values())
+    return ", ".join(f"{h.nom}: {h.requetes} requetes, {h.connexions()} connexions, {h.reessais} reessais" for h in hotes)
@@ -1,10 +1,20 @@
+import calendar
 import datetime
+import decimal
 from beancount.prices import source as bean_source
 
 import requests
 from beancount.core.number import D
 import logging
+import typing
 import pytz
+from fp_bc.sources import batch
+from fp_bc.sources import price_cache
+from fp_bc.sources import session
+
+URL_YAHOO = "https://query1.finance.yahoo.com"
+# nombre de symboles par requete de l'api quote
+TAILLE_LOT = 50
 
 
 class YahooError(ValueError):
@@ -13,30 +23,181 @@ class YahooError(ValueError):
 
 class Source(bean_source.Source):
     def get_latest_price(self, ticker: str) -> bean_source.SourcePrice:
+        return price_cache.get_cache().cached("yahoo", ticker, price_cache.TTL_YAHOO, lambda: self._get_latest_price(ticker))
+
+    def get_latest_prices(self, tickers: typing.Sequence[str]) -> typing.List[typing.Optional[bean_source.SourcePrice]]:
+        """derniers prix de plusieurs tickers, dans l'ordre des tickers.
+        les tickers absents du cache sont demandes par lots de TAILLE_LOT a l'api quote,
+        puis un par un (api chart) pour ceux qui manquent dans la reponse"""
+        prix = price_cache.get_cache().cached_plusieurs("yahoo", tickers, price_cache.TTL_YAHOO, self._cotations)
+        return [prix[ticker] for ticker in tickers]
+
+    def _cotations(self, tickers: typing.List[str]) -> typing.Dict[str, typing.Optional[bean_source.SourcePrice]]:
+        log = logging.getLogger()
+        lots = [",".join(tickers[i : i + TAILLE_LOT]) for i in range(0, len(tickers), TAILLE_LOT)]
+        resultats: typing.Dict[str, typing.Optional[bean_source.SourcePrice]] = {}
+        for cotations in batch.en_parallele(self._lot, lots, batch.hote(URL_YAHOO)):
+            resultats.update(cotations or {})
+        manquants = [ticker for ticker in tickers if ticker not in resultats]
+        if manquants:
+            log.info(f"yahoo: {len(manquants)} ticker(s) absents des lots, demandes un par un")
+            resultats.update(zip(manquants, batch.en_parallele(self._get_latest_price, manquants, batch.hote(URL_YAHOO))))
+        return resultats
+
+    def _lot(self, symbols: str) -> typing.Dict[str, bean_source.SourcePrice]:
+        """derniers prix d'un lot de symboles separes par des virgules, en une requete"""
+        log = logging.getLogger()
+        log.info(f"yahoo:{symbols}")
         try:
-            log = logging.getLogger()
-            log.info(f"yahoo:{ticker}")
-            response = requests.get(f"https://query1.finance.yahoo.com/v8/finance/chart/{ticker}", headers={'User-Agent': None})
+            response = session.get(f"{URL_YAHOO}/v7/finance/quote", params={"symbols": symbols}, headers={'User-Agent': None})
             try:
-                content = next(iter(response.json(parse_float=D).values()))
+                content = response.json(parse_float=D)["quoteResponse"]
             except Exception as exc:
                 log.debug(exc)
                 raise YahooError(f"Invalid response from Yahoo:  {response}")
-            if response.status_code != requests.codes.ok:
-                raise YahooError(f"Status {response.status_code}: {content['error']}")
-            if content['error'] is not None:
-                raise YahooError(f"Error fetching Yahoo data: {content['error']}")
-            result = content['result'][0]
+            if response.status_code != requests.codes.ok or content.get("error") is not None:
+                raise YahooError(f"Status {response.status_code}: {content.get('error')}")
+        except YahooError as e:
+            log.error(str(e))
+            return {}
+        demandes = {symbol.upper(): symbol for symbol in symbols.split(",")}
+        resultats = {}
+        for cotation in content.get("result") or ():
             try:
-                price = D(result["meta"]['regularMarketPrice']).quantize(D("0.01"))
-                timezone = pytz.timezone(result["meta"]['exchangeTimezoneName'])
-                trade_time = timezone.localize(datetime.datetime.fromtimestamp(result["meta"]['currentTradingPeriod']['regular']['end']))
-            except KeyError:
+                ticker = demandes[cotation["symbol"].upper()]
+                resultats[ticker] = _dernier_prix(cotation)
+            except (KeyError, TypeError, pytz.UnknownTimeZoneError):
+                # cotation incomplete: le ticker sera demande seul
+                continue
+            log.debug(f"yahoo:{ticker} \t {resultats[ticker]}")
+        return resultats
+
+    def _get_latest_price(self, ticker: str) -> bean_source.SourcePrice:
+        try:
+            log = logging.getLogger()
+            log.info(f"yahoo:{ticker}")
+            result = self._chart(ticker, parse_float=D)
+            try:
+                prix = _dernier_prix(result["meta"])
+            except (KeyError, TypeError, pytz.UnknownTimeZoneError):
                 raise YahooError(f"Invalid response from Yahoo: {repr(result)}")
-            currency = result["meta"]["currency"]
-            log.debug(f"yahoo:{ticker} \t price: {price} \t day:{trade_time} \t cur:{currency}")
-            # log.info(f"yahoo:{ticker} \t price: {price} \t day:{trade_time} \t cur:{currency}")
-            return bean_source.SourcePrice(price, trade_time, currency)
+            log.debug(f"yahoo:{ticker} \t {prix}")
+            return prix
+        except YahooError as e:
+            log.error(str(e))
+            return None
+
+    def get_historical_price(self, ticker: str, time: datetime.datetime) -> typing.Optional[bean_source.SourcePrice]:
+        """cours de cloture au jour demande, ou au dernier jour de cotation precedent.
+        la serie du ticker est gardee dans le cache des prix: seules les periodes jamais demandees sont telechargees"""
+        log = logging.getLogger()
+        log.info(f"yahoo:{ticker} {time.date()}")
+        try:
+            trouve = price_cache.get_cache().historique(
+                "yahoo", ticker, time.date(), lambda debut, fin: self._clotures(ticker, debut, fin)
+            )
+            if trouve is None:
+                raise YahooError(f"pas de cours pour {ticker} au {time.date()}")
+            currency, timezone = self._meta(ticker)
         except YahooError as e:
             log.error(str(e))
             return None
+        jour, price = trouve
+        return bean_source.SourcePrice(price.quantize(D("0.01")), _heure(jour, timezone), currency)
+
+    def get_prices_series(
+        self, ticker: str, time_begin: datetime.datetime, time_end: datetime.datetime
+    ) -> typing.Optional[typing.List[bean_source.SourcePrice]]:
+        """tous les cours de cloture entre deux dates, en une requete au plus par periode manquante du cache"""
+        log = logging.getLogger()
+        log.info(f"yahoo:{ticker} {time_begin.date()} -> {time_end.date()}")
+        try:
+            lignes = price_cache.get_cache().periode(
+                "yahoo", ticker, time_begin.date(), time_end.date(), lambda debut, fin: self._clotures(ticker, debut, fin)
+            )
+            currency, timezone = self._meta(ticker)
+        except YahooError as e:
+            log.error(str(e))
+            return None
+        return [bean_source.SourcePrice(price.quantize(D("0.01")), _heure(jour, timezone), currency) for jour, price in lignes]
+
+    def backfill(
+        self, tickers: typing.Sequence[str], time_begin: datetime.datetime, time_end: datetime.datetime
+    ) -> typing.Dict[str, typing.Optional[typing.List[bean_source.SourcePrice]]]:
+        """series de plusieurs tickers en parallele, une requete par ticker"""
+        series = batch.en_parallele(lambda ticker: self.get_prices_series(ticker, time_begin, time_end), tickers, batch.hote(URL_YAHOO))
+        return dict(zip(tickers, series))
+
+    def _chart(
+        self, ticker: str, params: typing.Optional[typing.Dict[str, typing.Any]] = None, parse_float: typing.Any = None
+    ) -> typing.Dict[str, typing.Any]:
+        """premier resultat de l'api chart"""
+        log = logging.getLogger()
+        response = session.get(f"{URL_YAHOO}/v8/finance/chart/{ticker}", params=params, headers={'User-Agent': None})
+        try:
+            content = next(iter(response.json(parse_float=parse_float).values()))
+        except Exception as exc:
+            log.debug(exc)
+            raise YahooError(f"Invalid response from Yahoo:  {response}")
+        if response.status_code != requests.codes.ok:
+            raise YahooError(f"Status {response.status_code}: {content['error']}")
+        if content['error'] is not None:
+            raise YahooError(f"Error fetching Yahoo data: {content['error']}")
+        return typing.cast(typing.Dict[str, typing.Any], content['result'][0])
+
+    def _clotures(self, ticker: str, debut: datetime.date, fin: datetime.date) -> typing.List[typing.Tuple[datetime.date, decimal.Decimal]]:
+        """cours de cloture journaliers entre debut et fin (dates de la place de cotation).
+        le json est lu avec des float et seules les clotures retenues sont converties en Decimal"""
+        # un jour de marge de chaque cote: les seances de certaines places commencent la veille en utc
+        result = self._chart(
+            ticker,
+            {
+                "period1": calendar.timegm((debut - datetime.timedelta(days=1)).timetuple()),
+                "period2": calendar.timegm((fin + datetime.timedelta(days=2)).timetuple()),
+                "interval": "1d",
+                "includeAdjustedClose": "false",
+            },
+        )
+        try:
+            meta = result["meta"]
+            timezone = pytz.timezone(meta["exchangeTimezoneName"])
+            horodatages = result.get("timestamp") or []
+            clotures = result["indicators"]["quote"][0]["close"] if horodatages else []
+        except (KeyError, IndexError):
+            raise YahooError(f"Invalid response from Yahoo: {ticker}")
+        price_cache.get_cache().identifiant("yahoo", ticker, lambda: f"{meta['currency']} {meta['exchangeTimezoneName']}")
+        lignes = []
+        for horodatage, cloture in zip(horodatages, clotures):
+            if cloture is None:
+                continue
+            jour = datetime.datetime.fromtimestamp(horodatage, timezone).date()
+            if debut <= jour <= fin:
+                # repr donne le litteral le plus court, celui du json: meme valeur qu'avec parse_float=D
+                lignes.append((jour, D(repr(cloture))))
+        return lignes
+
+    def _meta(self, ticker: str) -> typing.Tuple[str, str]:
+        """devise et fuseau horaire du ticker, gardes dans le cache des prix"""
+        valeur = price_cache.get_cache().identifiant("yahoo", ticker, lambda: self._chercher_meta(ticker))
+        if valeur is None:
+            raise YahooError(f"pas de devise pour {ticker}")
+        currency, timezone = valeur.split(" ")
+        return currency, timezone
+
+    def _chercher_meta(self, ticker: str) -> typing.Optional[str]:
+        meta = self._chart(ticker, {"range": "1d", "interval": "1d"})["meta"]
+        return f"{meta['currency']} {meta['exchangeTimezoneName']}"
+
+
+def _dernier_prix(cotation: typing.Dict[str, typing.Any]) -> bean_source.SourcePrice:
+    """dernier prix d'une cotation de l'api quote ou du meta de l'api chart (memes champs),
+    date de la derniere transaction dans le fuseau de la place de cotation
+    @raise KeyError, TypeError ou pytz.UnknownTimeZoneError si la cotation est incomplete"""
+    timezone = pytz.timezone(cotation["exchangeTimezoneName"])
+    trade_time = datetime.datetime.fromtimestamp(cotation["regularMarketTime"], timezone)
+    return bean_source.SourcePrice(D(cotation["regularMarketPrice"]).quantize(D("0.01")), trade_time, cotation["currency"])
+
+
+def _heure(jour: datetime.date, timezone: str) -> datetime.datetime:
+    """heure de cloture (16h) de la place de cotation"""
+    return pytz.timezone(timezone).localize(datetime.datetime(jour.year, jour.month, jour.day, 16))
@@ -10,9 +10,12 @@ import pprint
 import datetime
 import time
 import math
+import itertools
 from uuid import uuid4
 from collections.abc import Iterable
 
+_MONTANT_CENTIMES = re.compile(r"([+-]?)([0-9]*)(?:\.([0-9]{0,2}))?")
+
 
 class ExcelCsv(csv.Dialect):  # pylint: disable=R0903
     """Describe the usual properties of Excel-generated CSV files."""
@@ -43,7 +46,7 @@ class CsvUnicodeReader:  # pylint: disable=E1136
 
     def __init__(
         self,
-        fich: t.IO,
+        fich: t.Iterable[str],
         dialect: t.Any = ExcelCsv,
         champs: t.Optional[t.List[str]] = None,
         champ_detail: str = "detail",
@@ -52,6 +55,7 @@ class CsvUnicodeReader:  # pylint: disable=E1136
         if champs:
             self.champs = champs
         self.logger = logging.getLogger("CsvUnicodeReader")  # pylint: disable=W0612
+        self.debug = self.logger.isEnabledFor(logging.DEBUG)
         self.reader = csv.DictReader(fich, dialect=dialect, fieldnames=self.champs)
         self.frais = decimal.Decimal(0)
         self.champ_detail = champ_detail
@@ -64,9 +68,10 @@ class CsvUnicodeReader:  # pylint: disable=E1136
             self.line += 1
             self.row = next(self.reader)
         self.line += 1
-        self.logger.debug("ligne: %s", self.line)
         self.row = next(self.reader)
-        self.logger.debug("ligne: %s", self.row)
+        if self.debug:
+            self.logger.debug("ligne: %s", self.line)
+            self.logger.debug("ligne: %s", self.row)
         self.frais = decimal.Decimal(0)
         return self
 
@@ -104,6 +109,111 @@ class CsvUnicodeReader:  # pylint: disable=E1136
                 return texte
 
 
+class CsvFastReader:
+    """
+    meme interface que CsvUnicodeReader (row, detail, in_detail, __getitem__) mais plus rapide:
+    les lignes d'entete sont sautees sans etre analysees et chaque ligne reste une liste
+    adressee par l'indice precalcule de la colonne, sans creation de dict.
+    l'objet renvoye a chaque iteration est le lecteur lui meme, comme pour CsvUnicodeReader
+    """
+
+    __slots__ = ("champs", "index", "nb_champs", "fich", "reader", "logger", "debug", "frais", "champ_detail", "ligne_saut", "line", "ligne", "row")
+
+    def __str__(self) -> str:  # pragma: no cover
+        return pprint.pformat(dict(zip(self.champs, self.ligne)))
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __init__(
+        self,
+        fich: t.Iterable[str],
+        champs: t.List[str],
+        dialect: t.Any = ExcelCsv,
+        champ_detail: str = "detail",
+        ligne_saut: int = 0,
+    ) -> None:
+        self.champs = champs
+        self.index = {champ: i for i, champ in enumerate(champs)}
+        self.nb_champs = len(champs)
+        self.fich = iter(fich)
+        self.reader = csv.reader(self.fich, dialect=dialect)
+        self.logger = logging.getLogger("CsvUnicodeReader")
+        self.debug = self.logger.isEnabledFor(logging.DEBUG)
+        self.frais = decimal.Decimal(0)
+        self.champ_detail = champ_detail
+        self.ligne_saut = ligne_saut
+        self.line = 0
+        self.ligne: t.List[t.Optional[str]] = []
+        # compatibilite avec CsvUnicodeReader: row.row["champ"] fonctionne directement
+        self.row = self
+
+    def __next__(self) -> te.Self:
+        """fonction utiise pour rendre la classe iterable"""
+        if self.line < self.ligne_saut:
+            # comme DictReader, les lignes vides ne comptent pas
+            while self.line < self.ligne_saut:
+                if next(self.fich).strip("\r\n"):
+                    self.line += 1
+        self.line += 1
+        ligne = next(self.reader)
+        while not ligne:
+            ligne = next(self.reader)
+        if len(ligne) < self.nb_champs:
+            ligne.extend([None] * (self.nb_champs - len(ligne)))
+        self.ligne = ligne
+        if self.debug:
+            self.logger.debug("ligne: %s", self.line)
+            self.logger.debug("ligne: %s", ligne)
+        self.frais = decimal.Decimal(0)
+        return self
+
+    def __iter__(self) -> te.Self:
+        """fonction utiise pour rendre la classe iterable"""
+        return self
+
+    def __getitem__(self, key: str) -> t.Any:
+        return self.ligne[self.index[key]]
+
+    @property
+    def detail(self) -> str:
+        """retourne le champ detail"""
+        return t.cast(str, self.ligne[self.index[self.champ_detail]]).strip()
+
+    def in_detail(self, regxp: str, champ: str = "") -> t.Union[t.List[str], str, None]:
+        """fonction qui cherche danc champs la regexp re .
+        si ne seule reponse la renvoie sinon renvoie une liste
+        @param champ: lieu de la recherche
+        @param regxp: regexp a chercher
+        @return array or string
+        """
+        texte = re.findall(regxp, self[champ or self.champ_detail], re.UNICODE | re.IGNORECASE)
+        if not texte:
+            return None
+        if len(texte) == 1:
+            return texte[0]
+        return texte
+
+
+def lire_entete(fich: t.Iterable[str], nb_lignes: int) -> t.Tuple[t.List[str], t.Iterator[str]]:
+    """lit les premieres lignes d'un fichier, jusqu'a nb_lignes lignes non vides
+    (comme ligne_saut des lecteurs csv, les lignes vides ne comptent pas)
+    @param fich: fichier ouvert en mode texte
+    @param nb_lignes: nombre de lignes non vides de l'entete
+    @return les lignes lues et un iterateur sur tout le fichier qui reprend ces lignes sans relire le disque"""
+    fich = iter(fich)
+    entete: t.List[str] = []
+    non_vides = 0
+    while non_vides < nb_lignes:
+        ligne = next(fich, None)
+        if ligne is None:
+            break
+        entete.append(ligne)
+        if ligne.strip("\r\n"):
+            non_vides += 1
+    return entete, itertools.chain(entete, fich)
+
+
 def uuid() -> str:  # pragma: no cover
     """raccourci vers uuid4"""
     return str(uuid4())
@@ -136,6 +246,37 @@ class FormatException(UtilsException):
     pass
 
 
+# memes expressions que time.strptime pour les formats des releves, sans verrou ni struct_time
+_JOUR = r"(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])"
+_MOIS = r"(?P<m>1[0-2]|0[1-9]|[1-9])"
+_FORMATS_DATE: t.Dict[str, t.Pattern[str]] = {
+    "%d/%m/%Y": re.compile(_JOUR + "/" + _MOIS + r"/(?P<Y>\d\d\d\d)", re.IGNORECASE),
+    "%d.%m.%Y": re.compile(_JOUR + r"\." + _MOIS + r"\.(?P<Y>\d\d\d\d)", re.IGNORECASE),
+    "%Y-%m-%d": re.compile(r"(?P<Y>\d\d\d\d)-" + _MOIS + "-" + _JOUR, re.IGNORECASE),
+    "%d.%m.%y": re.compile(_JOUR + r"\." + _MOIS + r"\.(?P<y>\d\d)", re.IGNORECASE),
+    "%d-%m-%Y": re.compile(_JOUR + "-" + _MOIS + r"-(?P<Y>\d\d\d\d)", re.IGNORECASE),
+}
+# memo des dates deja lues: un releve repete souvent les memes dates
+_MEMO_DATE: t.Dict[t.Tuple[str, str], datetime.date] = {}
+TAILLE_MEMO_DATE = 4096
+
+
+def _strpdate_rapide(var: str, fmt: str) -> datetime.date:
+    """lit une date dans un format connu de _FORMATS_DATE, avec les memes regles que time.strptime
+    @raise ValueError: comme time.strptime"""
+    trouve = _FORMATS_DATE[fmt].match(var)
+    if trouve is None or trouve.end() != len(var):
+        raise ValueError(f"time data {var!r} does not match format {fmt!r}")
+    champs = trouve.groupdict()
+    if "Y" in champs:
+        annee = int(champs["Y"])
+    else:
+        # meme pivot que time.strptime pour %y
+        annee = int(champs["y"])
+        annee += 2000 if annee <= 68 else 1900
+    return datetime.date(annee, int(champs["m"]), int(champs["d"]))
+
+
 def strpdate(var: t.Any, fmt: str = "%Y-%m-%d") -> datetime.date:
     """renvoie la date
     @param var: variable d'entree
@@ -152,8 +293,18 @@ def strpdate(var: t.Any, fmt: str = "%Y-%m-%d") -> datetime.date:
             # noinspection PyTypeChecker
             return var
         var = "%s" % var
-        end_date = time.strptime(var, fmt)
-        return datetime.date(end_date.tm_year, end_date.tm_mon, end_date.tm_mday)
+        retour = _MEMO_DATE.get((var, fmt))
+        if retour is not None:
+            return retour
+        if fmt in _FORMATS_DATE:
+            retour = _strpdate_rapide(var, fmt)
+        else:
+            end_date = time.strptime(var, fmt)
+            retour = datetime.date(end_date.tm_year, end_date.tm_mon, end_date.tm_mday)
+        if len(_MEMO_DATE) >= TAILLE_MEMO_DATE:
+            _MEMO_DATE.clear()
+        _MEMO_DATE[(var, fmt)] = retour
+        return retour
     except ValueError:
         raise FormatException('"%s" n\'est pas est une date' % var)
 
@@ -170,6 +321,23 @@ def is_date(var: t.Any, fmt: str = "%Y-%m-%d") -> bool:
     return ok
 
 
+# memo des montants deja convertis par jeu d'options, les releves repetent souvent les memes montants
+# (les Decimal sont immuables donc partageables)
+_MEMO_DECIMAL: t.Dict[t.Tuple[bool, bool, bool], t.Dict[str, decimal.Decimal]] = {}
+TAILLE_MEMO_DECIMAL = 4096
+
+
+def _nettoie_montant(s: str, thousand_point: bool, virgule: bool, space: bool) -> str:
+    s = s.strip()
+    if thousand_point and "." in s:
+        s = s.replace(".", "")
+    if virgule and "," in s:
+        s = s.replace(",", ".")
+    if space and " " in s:
+        s = s.replace(" ", "")
+    return s
+
+
 def to_decimal(s: t.Any, thousand_point: bool = False, virgule: bool = True, space: bool = True) -> decimal.Decimal:
     """fonction qui renvoie un decimal en partant d'un nombre francais
     @param s: string representqnt le decimal
@@ -181,17 +349,59 @@ def to_decimal(s: t.Any, thousand_point: bool = False, virgule: bool = True, spa
         return decimal.Decimal("0")
     if thousand_point is True and virgule is False:
         raise RuntimeError("pas possible d'avoir les deux thousand_point et virgule")
-    s = str(s).strip()
-    if thousand_point:
-        s = s.replace(".", "")
-    if virgule:
-        s = s.replace(",", ".")
-    if space:
-        s = s.replace(" ", "")
-    retour = decimal.Decimal(s)
+    s = str(s)
+    memo = _MEMO_DECIMAL.get((thousand_point, virgule, space))
+    if memo is None:
+        memo = _MEMO_DECIMAL[(thousand_point, virgule, space)] = {}
+    retour = memo.get(s)
+    if retour is not None:
+        return retour
+    retour = decimal.Decimal(_nettoie_montant(s, thousand_point, virgule, space))
+    if len(memo) >= TAILLE_MEMO_DECIMAL:
+        memo.clear()
+    memo[s] = retour
     return retour
 
 
+def _verifie_centimes(v: str) -> t.Match[str]:
+    """verifie qu'un montant nettoye est de la forme "-1234.5" (au plus deux decimales)
+    @raise FormatException: sinon"""
+    trouve = _MONTANT_CENTIMES.fullmatch(v)
+    if trouve is None or not (trouve.group(2) or trouve.group(3)):
+        raise FormatException(f'"{v}" n\'est pas un montant en centimes')
+    return trouve
+
+
+def _centimes(v: str) -> int:
+    """convertit un montant nettoye ("-1234.5") en centimes entiers sans passer par Decimal"""
+    signe, entier, decimales = _verifie_centimes(v).groups()
+    centimes = int(entier or "0") * 100 + int((decimales or "").ljust(2, "0"))
+    return -centimes if signe == "-" else centimes
+
+
+def to_centimes(
+    valeurs: t.Iterable[t.Any], thousand_point: bool = False, virgule: bool = True, space: bool = True
+) -> t.List[int]:
+    """convertit en une passe une colonne de montants (francais "1 234,56" ou allemand "1.234,56") en centimes entiers.
+    chaque chaine distincte n'est analysee qu'une fois, en entiers exacts quelle que soit la taille du montant.
+    @param valeurs: montants sous forme de chaine, une valeur vide vaut 0
+    @return liste d'entiers, le Decimal n'est cree qu'au besoin avec centimes_to_decimal
+    @raise FormatException: si un montant n'est pas un nombre ou a plus de deux decimales"""
+    if thousand_point is True and virgule is False:
+        raise RuntimeError("pas possible d'avoir les deux thousand_point et virgule")
+    valeurs = [str(v) if v else "0" for v in valeurs]
+    distinctes = list(dict.fromkeys(valeurs))
+    nettoyees = [_nettoie_montant(v, bool(thousand_point), bool(virgule), bool(space)) for v in distinctes]
+    centimes = [_centimes(v) for v in nettoyees]
+    correspondance = dict(zip(distinctes, centimes))
+    return [correspondance[v] for v in valeurs]
+
+
+def centimes_to_decimal(centimes: int) -> decimal.Decimal:
+    """cree le decimal a deux decimales correspondant a un montant en centimes"""
+    return decimal.Decimal(centimes).scaleb(-2)
+
+
 def is_number(s: t.Any) -> bool:
     """fonction qui verifie si ca a l'apparence d'un nombre
     @param s: whatever
@@ -33,6 +33,16 @@ bc_directives = t.Union[
 ]
 
 
+def collect(iterateur: t.Generator[bc_directives, None, int]) -> t.Tuple[t.List[bc_directives], int]:
+    """consomme un iter_extract et renvoie la liste des directives et le nombre d'erreurs renvoye a la fin"""
+    entries: t.List[bc_directives] = []
+    while True:
+        try:
+            entries.append(next(iterateur))
+        except StopIteration as fin:
+            return entries, fin.value or 0
+
+
 def printer_entries(entries: t.Sequence[bc_directives], filename: str) -> None:
     entries = sort(entries)
     previous_type = type(entries[0])
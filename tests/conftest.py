@@ -0,0 +1,34 @@
+import os
+import typing
+
+import pytest
+
+from fp_bc.sources import amf
+from fp_bc.sources import batch
+from fp_bc.sources import eod
+from fp_bc.sources import price_cache
+from fp_bc.sources import yahoo
+from tests import standin
+
+
+@pytest.fixture(scope="session")
+def url_standin() -> typing.Iterator[str]:
+    serveur, url = standin.demarrer()
+    yield url
+    serveur.shutdown()
+
+
+@pytest.fixture
+def hors_ligne(url_standin: str, tmp_path: typing.Any, monkeypatch: pytest.MonkeyPatch) -> typing.Iterator[str]:
+    """sources amf, eod et yahoo dirigees vers le serveur local, sans limite de debit, avec un cache vide
+    @return le chemin du fichier du cache"""
+    monkeypatch.setattr(amf, "URL_GECO", url_standin)
+    monkeypatch.setattr(eod, "URL_EOD", url_standin + "/api")
+    monkeypatch.setattr(yahoo, "URL_YAHOO", url_standin)
+    monkeypatch.setenv("APIKEY_eob", "cle")
+    batch.configurer(url_standin, batch.Limite(1e6, 1e6, 8))
+    chemin = os.path.join(str(tmp_path), "prix.sqlite")
+    price_cache.set_cache(price_cache.PriceCache(chemin))
+    standin.reinitialiser()
+    yield chemin
+    price_cache.set_cache(None)
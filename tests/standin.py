@@ -0,0 +1,191 @@
+"""serveur http local qui imite geco (amf), eodhistoricaldata et yahoo finance pour les essais hors ligne.
+compte les requetes par api et peut simuler une latence ou des erreurs 503"""
+
+import collections
+import datetime
+import http.server
+import json
+import threading
+import time
+import typing
+import urllib.parse
+
+# latence: secondes ajoutees a chaque reponse, requetes: compteur par api (et "total"), echecs: nombre de 503 a renvoyer
+ETAT: typing.Dict[str, typing.Any] = {"latence": 0.0, "requetes": collections.Counter(), "echecs": 0, "octets": 0, "actives": 0, "max_actives": 0}
+_verrou = threading.Lock()
+
+
+def amf_recherche(isin: str) -> str:
+    """page de resultat de la recherche d'un isin; un isin commencant par XX n'existe pas"""
+    if isin.startswith("XX"):
+        return '<html><label id="Nbrep"><caption>Votre recherche a abouti à 0 réponse(s).</caption></label></html>'
+    remplissage = "".join(f'<tr class="other"><td>bla {i}</td><td>{"x" * 50}</td></tr>' for i in range(400))
+    return (
+        f'<html><body><table>{remplissage}'
+        f'<tr><td class="ResultatCritere">Code ISIN :</td><td class="ResultatCritereValue">{isin}</td></tr>'
+        '<tr><td class="ResultatCritere">Date VL :</td><td class="ResultatCritereValue">14/10/2026</td></tr>'
+        "<tr><td>Valeur (€) :</td><td>1 234,567</td></tr></table>"
+        f'<form><input name="NumProd" value="{sum(map(ord, isin)) % 9999}"/><input name="NumPart" value="7"/></form></body></html>'
+    )
+
+
+def amf_historique(requete: typing.Dict[str, typing.List[str]]) -> str:
+    """valeurs liquidatives des jours ouvres entre DateDeb et DateFin, de la plus recente a la plus ancienne"""
+    debut = datetime.datetime.strptime(requete["DateDeb"][0], "%d/%m/%Y").date()
+    jour = datetime.datetime.strptime(requete["DateFin"][0], "%d/%m/%Y").date()
+    lignes = []
+    while jour >= debut:
+        if jour.weekday() < 5:
+            classe = "ligne2" if len(lignes) % 2 == 0 else "ligne1"
+            lignes.append(f'<tr class="{classe}"><td>{jour.strftime("%d/%m/%Y")}</td><td>{vl_amf(jour)}</td></tr>')
+        jour -= datetime.timedelta(days=1)
+    remplissage = "".join(f'<div class="x"><span>{"y" * 80}</span></div>' for _ in range(300))
+    return f'<html><body>{remplissage}<table>{"".join(lignes)}</table></body></html>'
+
+
+def vl_amf(jour: datetime.date) -> str:
+    return f"{100 + jour.toordinal() % 50},{jour.day:02d}"
+
+
+def eod_cours(requete: typing.Dict[str, typing.List[str]]) -> typing.List[typing.Dict[str, typing.Any]]:
+    """cours de cloture des jours ouvres sur dix ans, bornes par from et to"""
+    fin = datetime.date(2026, 10, 16)
+    debut = fin - datetime.timedelta(days=3650)
+    if "from" in requete:
+        debut = max(debut, datetime.date.fromisoformat(requete["from"][0]))
+    if "to" in requete:
+        fin = min(fin, datetime.date.fromisoformat(requete["to"][0]))
+    lignes = []
+    jour = debut
+    while jour <= fin:
+        if jour.weekday() < 5:
+            lignes.append(
+                {"date": jour.isoformat(), "open": 1.5, "high": 2.5, "low": 1.0, "close": 100 + jour.toordinal() % 37 + 0.123, "adjusted_close": 1, "volume": 0}
+            )
+        jour += datetime.timedelta(days=1)
+    if requete.get("order", ["a"])[0] == "d":
+        lignes.reverse()
+    return lignes
+
+
+def cloture_yahoo(horodatage: int) -> float:
+    return 100 + (horodatage // 86400) % 41 + 0.25
+
+
+def yahoo_chart(ticker: str, requete: typing.Dict[str, typing.List[str]]) -> typing.Dict[str, typing.Any]:
+    """api chart: meta seule, ou clotures quotidiennes (13h30 utc, jours ouvres) entre period1 et period2"""
+    meta = {
+        "currency": "USD",
+        "symbol": ticker,
+        "exchangeTimezoneName": "America/New_York",
+        "regularMarketPrice": 123.456,
+        "regularMarketTime": 1760644800,
+        "currentTradingPeriod": {"regular": {"start": 1760621400, "end": 1760644800}},
+    }
+    resultat: typing.Dict[str, typing.Any] = {"meta": meta}
+    if "period1" in requete:
+        debut, fin = int(requete["period1"][0]), int(requete["period2"][0])
+        horodatages = [
+            h
+            for h in range(debut - debut % 86400 + 13 * 3600 + 1800, fin, 86400)
+            if datetime.datetime.fromtimestamp(h, datetime.timezone.utc).weekday() < 5
+        ]
+        nb = len(horodatages)
+        resultat["timestamp"] = horodatages
+        resultat["indicators"] = {
+            "quote": [{"open": [1.0] * nb, "high": [2.0] * nb, "low": [0.5] * nb, "volume": [1000] * nb, "close": [cloture_yahoo(h) for h in horodatages]}],
+            "adjclose": [{"adjclose": [1.0] * nb}],
+        }
+    return {"chart": {"result": [resultat], "error": None}}
+
+
+def yahoo_quote(requete: typing.Dict[str, typing.List[str]]) -> typing.Dict[str, typing.Any]:
+    """api quote: un resultat par symbole, sauf pour les symboles commencant par MISS"""
+    resultats = []
+    for symbole in requete["symbols"][0].split(","):
+        if symbole.startswith("MISS"):
+            continue
+        paris = symbole.endswith(".PA")
+        resultats.append(
+            {
+                "symbol": symbole,
+                "regularMarketPrice": 50.125,
+                "currency": "EUR" if paris else "USD",
+                "exchangeTimezoneName": "Europe/Paris" if paris else "America/New_York",
+                "regularMarketTime": 1760644800,
+            }
+        )
+    return {"quoteResponse": {"result": resultats, "error": None}}
+
+
+class Gestionnaire(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args: typing.Any) -> None:
+        pass
+
+    def do_GET(self) -> None:  # pylint: disable=C0103
+        with _verrou:
+            ETAT["actives"] += 1
+            ETAT["max_actives"] = max(ETAT["max_actives"], ETAT["actives"])
+        try:
+            self._repondre()
+        finally:
+            with _verrou:
+                ETAT["actives"] -= 1
+
+    def _envoyer(self, statut: int, corps: bytes, type_contenu: str = "text/plain") -> None:
+        self.send_response(statut)
+        self.send_header("Content-Type", type_contenu)
+        self.send_header("Content-Length", str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def _repondre(self) -> None:
+        url = urllib.parse.urlparse(self.path)
+        requete = urllib.parse.parse_qs(url.query)
+        with _verrou:
+            ETAT["requetes"]["chart" if "/chart/" in url.path else url.path.split("/")[-1]] += 1
+            ETAT["requetes"]["total"] += 1
+            echec = ETAT["echecs"] > 0
+            if echec:
+                ETAT["echecs"] -= 1
+        time.sleep(ETAT["latence"])
+        if echec:
+            self._envoyer(503, b"busy")
+            return
+        type_contenu = "application/json"
+        if url.path.endswith("rech_part.aspx"):
+            corps, type_contenu = amf_recherche(requete["CodeISIN"][0]), "text/html; charset=utf-8"
+        elif url.path.endswith("info_part.aspx"):
+            corps, type_contenu = amf_historique(requete), "text/html; charset=utf-8"
+        elif "/api/eod/" in url.path:
+            corps = json.dumps(eod_cours(requete))
+        elif "/v8/finance/chart/" in url.path:
+            corps = json.dumps(yahoo_chart(url.path.split("/")[-1], requete))
+        elif url.path.endswith("/v7/finance/quote"):
+            corps = json.dumps(yahoo_quote(requete))
+        else:
+            self._envoyer(404, b"")
+            return
+        donnees = corps.encode("utf-8")
+        with _verrou:
+            ETAT["octets"] += len(donnees)
+        self._envoyer(200, donnees, type_contenu)
+
+
+def demarrer() -> typing.Tuple[http.server.ThreadingHTTPServer, str]:
+    """lance le serveur sur un port libre dans un thread
+    @return le serveur et son url de base"""
+    serveur = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Gestionnaire)
+    serveur.daemon_threads = True
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    return serveur, f"http://127.0.0.1:{serveur.server_address[1]}"
+
+
+def reinitialiser() -> None:
+    """remet les compteurs a zero, sans latence ni erreur"""
+    with _verrou:
+        ETAT["requetes"].clear()
+        ETAT.update(latence=0.0, echecs=0, octets=0, max_actives=0)
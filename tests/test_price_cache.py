@@ -0,0 +1,72 @@
+import datetime
+import itertools
+from unittest import mock
+
+import pytz
+from beancount.core.number import D
+from beancount.prices import source as bean_source
+
+from fp_bc.sources import amf
+from fp_bc.sources import eod
+from fp_bc.sources import price_cache
+from fp_bc.sources import yahoo
+from tests import standin
+
+PRIX = bean_source.SourcePrice(D("12.34"), datetime.datetime(2026, 10, 14, 17, 30, tzinfo=pytz.utc), "EUR")
+
+
+def test_ttl_expire() -> None:
+    cache = price_cache.PriceCache(":memory:")
+    with mock.patch.object(price_cache.time, "time", return_value=1000.0):
+        cache.put("yahoo", "AAPL", PRIX)
+    with mock.patch.object(price_cache.time, "time", return_value=1000.0 + price_cache.TTL_YAHOO):
+        assert cache.get("yahoo", "AAPL", price_cache.TTL_YAHOO) == PRIX
+    with mock.patch.object(price_cache.time, "time", return_value=1001.0 + price_cache.TTL_YAHOO):
+        assert cache.get("yahoo", "AAPL", price_cache.TTL_YAHOO) is None
+        # un prix historique n'expire pas
+        assert cache.get("yahoo", "AAPL", price_cache.TTL_HISTORIQUE) == PRIX
+
+
+def test_lru_supprime_les_moins_utilises() -> None:
+    cache = price_cache.PriceCache(":memory:", taille_max=5)
+    horloge = itertools.count(1000.0)
+    with mock.patch.object(price_cache.time, "time", side_effect=lambda: next(horloge)):
+        for i in range(5):
+            cache.put("amf", f"t{i}", PRIX)
+        assert cache.get("amf", "t0", None) == PRIX
+        cache.put("amf", "t5", PRIX)
+        cache.put("amf", "t6", PRIX)
+    restants = {ticker for (ticker,) in cache.connexion.execute("SELECT ticker FROM prix")}
+    assert restants == {"t0", "t3", "t4", "t5", "t6"}
+
+
+def test_memo_du_run_garde_les_echecs() -> None:
+    cache = price_cache.PriceCache(":memory:")
+    fetch = mock.Mock(return_value=None)
+    assert cache.cached("eod", "LU1", price_cache.TTL_EOD, fetch) is None
+    assert cache.cached("eod", "LU1", price_cache.TTL_EOD, fetch) is None
+    assert fetch.call_count == 1
+    # un echec n'est pas ecrit sur disque: le run suivant redemande
+    assert cache.connexion.execute("SELECT COUNT(*) FROM prix").fetchone()[0] == 0
+
+
+def test_dernier_prix_lu_dans_le_cache(hors_ligne: str) -> None:
+    sources = ((amf.Source(), "FR0000000001"), (eod.Source(), "LU1"), (yahoo.Source(), "AAPL"))
+    premiers = [source.get_latest_price(ticker) for source, ticker in sources]
+    assert None not in premiers
+    assert premiers[0].price == D("1234.57")
+    assert [source.get_latest_price(ticker) for source, ticker in sources] == premiers
+    assert standin.ETAT["requetes"]["total"] == 3
+    # nouveau run: memo vide, les prix viennent du fichier
+    price_cache.set_cache(price_cache.PriceCache(hors_ligne))
+    standin.reinitialiser()
+    assert [source.get_latest_price(ticker) for source, ticker in sources] == premiers
+    assert standin.ETAT["requetes"]["total"] == 0
+
+
+def test_dernier_prix_redemande_apres_le_ttl(hors_ligne: str) -> None:
+    yahoo.Source().get_latest_price("AAPL")
+    price_cache.set_cache(price_cache.PriceCache(hors_ligne))
+    with mock.patch.object(price_cache.time, "time", return_value=price_cache.time.time() + price_cache.TTL_YAHOO + 1):
+        assert yahoo.Source().get_latest_price("AAPL") is not None
+    assert standin.ETAT["requetes"]["chart"] == 2
@@ -0,0 +1,66 @@
+import calendar
+import datetime
+import random
+
+import pytz
+from beancount.core.number import D
+
+from fp_bc.sources import price_cache
+from fp_bc.sources import yahoo
+from tests import standin
+
+DEBUT = datetime.date(2024, 1, 1)
+
+
+def heure(jour: datetime.date) -> datetime.datetime:
+    return datetime.datetime(jour.year, jour.month, jour.day, 16, tzinfo=pytz.utc)
+
+
+def cloture(jour: datetime.date) -> D:
+    """cloture servie par le serveur local pour le dernier jour ouvre <= jour"""
+    while jour.weekday() >= 5:
+        jour -= datetime.timedelta(days=1)
+    return D(str(standin.cloture_yahoo(calendar.timegm(jour.timetuple()) + 13 * 3600 + 1800))).quantize(D("0.01"))
+
+
+def test_historique_sert_les_dates_voisines(hors_ligne: str) -> None:
+    jours = [DEBUT + datetime.timedelta(days=i) for i in range(700)]
+    random.Random(2).shuffle(jours)
+    source = yahoo.Source()
+    for jour in jours:
+        prix = source.get_historical_price("AAPL", heure(jour))
+        assert prix is not None
+        assert prix.price == cloture(jour)
+        assert prix.time.date() <= jour and prix.quote_currency == "USD"
+        assert str(prix.time.tzinfo) == "America/New_York"
+    # chaque requete couvre un an autour de la date: quelques requetes pour 700 dates
+    assert standin.ETAT["requetes"]["chart"] <= 4
+
+
+def test_serie_lue_dans_le_cache(hors_ligne: str) -> None:
+    source = yahoo.Source()
+    source.get_historical_price("AAPL", heure(datetime.date(2024, 3, 15)))
+    price_cache.set_cache(price_cache.PriceCache(hors_ligne))
+    standin.reinitialiser()
+    serie = yahoo.Source().get_prices_series("AAPL", heure(datetime.date(2024, 3, 1)), heure(datetime.date(2024, 3, 31)))
+    assert serie is not None
+    assert standin.ETAT["requetes"]["total"] == 0
+    assert len(serie) == 21
+    assert [prix.price for prix in serie] == [cloture(prix.time.date()) for prix in serie]
+
+
+def test_lots_et_repli_par_symbole(hors_ligne: str) -> None:
+    tickers = [f"S{i}" + (".PA" if i % 3 == 0 else "") for i in range(2 * yahoo.TAILLE_LOT + 7)] + ["MISS1", "MISS2"]
+    prix = yahoo.Source().get_latest_prices(tickers)
+    assert None not in prix
+    # trois lots a l'api quote, puis l'api chart pour les deux symboles absents des reponses
+    assert standin.ETAT["requetes"]["quote"] == 3
+    assert standin.ETAT["requetes"]["chart"] == 2
+    assert prix[0].quote_currency == "EUR" and str(prix[0].time.tzinfo) == "Europe/Paris"
+    assert prix[1].quote_currency == "USD" and prix[1].price == D("50.12")
+    assert prix[-1].price == D("123.46")
+    # meme horodatage (regularMarketTime) par l'api quote et par l'api chart
+    assert prix[-1].time == prix[1].time and str(prix[-1].time.tzinfo) == str(prix[1].time.tzinfo)
+    standin.reinitialiser()
+    assert yahoo.Source().get_latest_prices(tickers) == prix
+    assert standin.ETAT["requetes"]["total"] == 0